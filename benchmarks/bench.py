@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""TRIG的基准测试
+
+$ python benchmarks/bench.py --output result.json
+$ python benchmarks/bench.py --baseline benchmarks/baseline.json --threshold 0.25
+
+各项测试的结果为每次操作所用的时间（每轮至少20ms，取多轮中最快的一轮），以JSON输出。
+给出--baseline时，与基线比较，若某项变慢超过threshold则以状态码1退出。
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trig
+from corpus import (BATCH_LEFT, BATCH_SIZE, INEQUALITIES, IRRATIONAL, LARGE_COEFF, NUMBERS, RADICANDS,
+                    RANGES, SPECIAL_VALUES, TRIANGLES, WIDE_DOMAINS)
+
+
+def clear_caches():
+    """清空trig中的各种缓存，用于测量未命中缓存时的速度"""
+    trig.set_num_cache_size(trig.num_cache_size)
+    trig.square_free.cache_clear()
+    trig.compile_expr.cache_clear()
+    trig.parse_wave.cache_clear()
+    trig.wave_range.cache_clear()
+
+
+def calibrate():
+    """与trig无关的固定运算所用的时间，用于扣除机器忽快忽慢的影响（见measure）"""
+    start = time.perf_counter()
+    total = 0
+    for i in range(20000):
+        total += len(str(i * 7919 % 1009)) + (i & 3)
+    return time.perf_counter() - start
+
+
+def measure(func, repeat, setup=None, min_time=0.02):
+    """返回func每次操作所用的时间、操作数及calibrate所用的时间
+
+    每轮循环执行func直至用时超过min_time，接着执行一次calibrate，取repeat轮中最快的一轮（calibrate也取最快的）；
+    setup在每次执行前调用，不计入用时
+    """
+    best, number, unit = None, 1, None
+    with redirect_stdout(io.StringIO()):
+        for i in range(repeat + 1):
+            elapsed, n = 0, 0
+            for _ in range(number):
+                if setup is not None:
+                    setup()
+                start = time.perf_counter()
+                n += func()
+                elapsed += time.perf_counter() - start
+            if i == 0:
+                # 第一轮用于预热及确定每轮的循环次数
+                number = max(1, int(min_time * number / elapsed) + 1)
+                continue
+            unit = min(calibrate(), unit or float("inf"))
+            if (best is None) or (elapsed / n < best[0] / best[1]):
+                best = elapsed, n
+    return best + (unit,)
+
+
+def set_domain(domain):
+    trig.D = [float(trig.trig_eval(s)) for s in domain]
+
+
+def bench_equ(problems):
+    def run():
+        for left, right in problems:
+            trig.equ(left, right)
+        return len(problems)
+    return run
+
+
+def bench_equ_domain():
+    for left, right, domain in WIDE_DOMAINS:
+        set_domain(domain)
+        trig.equ(left, right)
+    return len(WIDE_DOMAINS)
+
+
+def bench_inequ():
+    for left, right, op in INEQUALITIES:
+        trig.inequ(left, right, op)
+    return len(INEQUALITIES)
+
+
+def bench_sol_trig():
+    for args in TRIANGLES:
+        trig.sol_trig(*args.split(" "))
+    return len(TRIANGLES)
+
+
+def bench_get_num_string():
+    for value in NUMBERS:
+        trig.get_num_string(value)
+        trig.get_num_string(value, True)
+    return 2 * len(NUMBERS)
+
+
+def bench_simplify_sqrt():
+    for value in RADICANDS:
+        trig.simplify_sqrt(value)
+    return len(RADICANDS)
+
+
+def bench_trig_eval():
+    for left, right in SPECIAL_VALUES + IRRATIONAL:
+        trig.trig_eval(left, "trig")
+        trig.trig_eval(right)
+    return 2 * len(SPECIAL_VALUES + IRRATIONAL)
+
+
+def bench_get_trig():
+    n = 0
+    for name in "sc":
+        for value in [-1, -0.8660254037844386, -0.7071067811865476, -0.5, 0, 0.5, 0.7071067811865476, 0.8660254037844386, 0.3]:
+            trig.get_trig(name, value)
+            n += 1
+    return n
+
+
+def bench_identify():
+    for value in NUMBERS:
+        trig.identify(value)
+    return len(NUMBERS)
+
+
+def bench_solve_range():
+    for expr, domain in RANGES:
+        str(trig.solve_range(expr, None if domain is None else [float(trig.trig_eval(s)) for s in domain]))
+    return len(RANGES)
+
+
+def batch_values():
+    """equ_many、wave_range_many、solve_triangles所用的数据（固定的伪随机数）"""
+    np = trig.load_numpy()
+    rng = np.random.default_rng(0)
+    values = rng.uniform(-1, 1, BATCH_SIZE)
+    values[::10] = rng.choice([-1, -0.5, 0, 0.5, 1, np.sqrt(2) / 2, np.sqrt(3) / 2], len(values[::10]))
+    return np, rng, values
+
+
+def bench_equ_many():
+    _, _, values = batch_values()
+
+    def run():
+        for left in BATCH_LEFT:
+            trig.equ_many(left, values, domain=[0, 10]).solutions
+        return len(BATCH_LEFT) * len(values)
+    return run
+
+
+def bench_wave_range_many():
+    np, rng, _ = batch_values()
+    starts = rng.uniform(-10, 10, BATCH_SIZE)
+    ends = starts + rng.uniform(0, 8, BATCH_SIZE)
+
+    def run():
+        trig.wave_range_many(3, 4, 1, 2, starts, ends)
+        return BATCH_SIZE
+    return run
+
+
+def bench_solve_triangles():
+    np, rng, _ = batch_values()
+    a, b, c, A, B, C = [rng.uniform(1, 2, BATCH_SIZE) for _ in range(3)] + [rng.uniform(0.2, 1.4, BATCH_SIZE) for _ in range(3)]
+    # 边边边（a、b、c）、边角边（b、A、c）、角边角（B、a、C）各占三分之一
+    kind, nan = np.arange(BATCH_SIZE) % 3, np.nan
+    columns = {"a": np.where(kind != 1, a, nan), "b": np.where(kind <= 1, b, nan), "c": np.where(kind <= 1, c, nan),
+               "A": np.where(kind == 1, A, nan), "B": np.where(kind == 2, B, nan), "C": np.where(kind == 2, C, nan)}
+
+    def run():
+        trig.solve_triangles(columns)
+        return BATCH_SIZE
+    return run
+
+
+def repl_commands():
+    """端到端测试所用的命令"""
+    commands = []
+    for left, right in SPECIAL_VALUES + IRRATIONAL + LARGE_COEFF:
+        commands.append("do %s=%s" % (left, right))
+    for left, right, op in INEQUALITIES:
+        commands.append("do %s%s%s" % (left, op, right))
+    for left, right, domain in WIDE_DOMAINS[:2]:
+        commands.append("set D %s %s" % domain)
+        commands.append("do %s=%s" % (left, right))
+    for args in TRIANGLES:
+        commands.append("trig " + args)
+    return commands
+
+
+def bench_repl():
+    commands = repl_commands()
+    for command in commands:
+        trig.run_command(command)
+    return len(commands)
+
+
+BENCHMARKS = [
+    # (名称, 函数, 是否在每轮前清空缓存)
+    ("equ.special", bench_equ(SPECIAL_VALUES), True),
+    ("equ.irrational", bench_equ(IRRATIONAL), True),
+    ("equ.large_coeff", bench_equ(LARGE_COEFF), True),
+    ("equ.wide_domain", bench_equ_domain, True),
+    ("inequ", bench_inequ, True),
+    ("sol_trig", bench_sol_trig, True),
+    ("get_num_string.cold", bench_get_num_string, True),
+    ("get_num_string.warm", bench_get_num_string, False),
+    ("simplify_sqrt.cold", bench_simplify_sqrt, True),
+    ("trig_eval.cold", bench_trig_eval, True),
+    ("trig_eval.warm", bench_trig_eval, False),
+    ("get_trig", bench_get_trig, False),
+    ("identify", bench_identify, False),
+    ("solve_range", bench_solve_range, True),
+    ("equ_many", bench_equ_many(), False),
+    ("wave_range_many", bench_wave_range_many(), False),
+    ("solve_triangles", bench_solve_triangles(), False),
+    ("repl.cold", bench_repl, True),
+    ("repl.warm", bench_repl, False),
+]
+
+
+def run(names=None, repeat=5):
+    results = {}
+    for name, func, cold in BENCHMARKS:
+        if names and not any(name.startswith(n) for n in names):
+            continue
+        seconds, n, unit = measure(func, repeat, clear_caches if cold else None)
+        results[name] = {"ops": n, "seconds": seconds, "per_op": seconds / n, "calibrate": unit}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较，返回变慢超过threshold的项
+
+    两者都记录了calibrate时，比较的是各项的用时与同一轮中calibrate的用时之比，使机器忽快忽慢时结果仍可比较
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline["results"]:
+            continue
+        base = baseline["results"][name]
+        ratio = result["per_op"] / base["per_op"]
+        if ("calibrate" in result) and ("calibrate" in base):
+            ratio *= base["calibrate"] / result["calibrate"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print("%-22s %10.2fus %10.2fus %7.2fx %s" % (name, baseline["results"][name]["per_op"] * 1e6, result["per_op"] * 1e6, ratio, flag), file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TRIG的基准测试")
+    parser.add_argument("names", nargs="*", help="只运行以这些名称开头的测试")
+    parser.add_argument("--repeat", type=int, default=7, help="每项测试的轮数")
+    parser.add_argument("--output", help="将结果写入该文件（默认输出到标准输出）")
+    parser.add_argument("--baseline", help="与该基线文件比较")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的变慢比例")
+    args = parser.parse_args(argv)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "results": run(args.names, args.repeat)
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report["results"], baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""基准测试所用的固定题目"""
+
+# 右边为特殊值的方程
+SPECIAL_VALUES = [
+    ("sin(x)", "1/2"), ("sin(x)", "-sqrt(2)/2"), ("sin(2*x)", "sqrt(3)/2"), ("sin(x)", "1"),
+    ("cos(x)", "1/2"), ("cos(x)", "-sqrt(3)/2"), ("cos(3*x)", "sqrt(2)/2"), ("cos(x/2)", "0"),
+    ("tan(x)", "1"), ("tan(x)", "-sqrt(3)"), ("tan(2*x)", "sqrt(3)/3"), ("tan(x)", "0"),
+]
+
+# 右边为一般无理数的方程（使用反三角函数表示）
+IRRATIONAL = [
+    ("sin(x)", "1/3"), ("sin(x)", "sqrt(5)/3"), ("sin(2*x)", "-2/7"), ("cos(x)", "0.2"),
+    ("cos(x)", "sqrt(7)/4"), ("cos(5*x)", "-3/8"), ("tan(x)", "2"), ("tan(x)", "sqrt(5)"),
+]
+
+# x的系数较大的方程
+LARGE_COEFF = [
+    ("sin(200*x)", "1/2"), ("cos(123*x)", "sqrt(3)/2"), ("tan(1000*x)", "1"), ("sin(97*x/5)", "-1/2"),
+]
+
+# 定义域较宽的方程，(左边, 右边, 定义域)
+WIDE_DOMAINS = [
+    ("sin(x)", "1/2", ("0", "2000*pi")),
+    ("cos(3*x)", "sqrt(2)/2", ("-500*pi", "500*pi")),
+    ("tan(2*x)", "1", ("0", "1000*pi")),
+    ("sin(200*x)", "1/2", ("-10", "10")),
+]
+
+# 不等式，(左边, 右边, 不等号)
+INEQUALITIES = [
+    ("sin(x)", "1/2", ">"), ("sin(x)", "1/2", "<"), ("sin(x)", "-sqrt(2)/2", ">="), ("sin(x)", "0", "<"),
+    ("cos(x)", "sqrt(3)/2", ">"), ("cos(x)", "1/2", "<"), ("cos(x)", "-1/2", ">"), ("cos(x)", "0", "<="),
+    ("tan(x)", "1", ">"), ("tan(x)", "-1", "<="),
+]
+
+# 解三角形的命令参数
+TRIANGLES = [
+    "a=3 b=4 c=5 get area",
+    "a=7 b=8 c=9 get area",
+    "b=sqrt(3) B=pi/3 get 2*a+c",
+    "b=sqrt(3) B=pi/3 get area",
+    "a=2 A=pi/6 get b+c",
+    "c=1 C=pi/2 get a+b",
+    "c=5 C=2*pi/3 get a-2*b+c",
+]
+
+# get_num_string所识别的数
+NUMBERS = [
+    0.5, -0.5, 0.75, 1 / 3, 22 / 7, 3.0, -12.0,
+    0.7071067811865476, 0.8660254037844386, 1.7320508075688772, 2.6457513110645907, 1.2990381056766578,
+    0.5235987755982988, 1.0471975511965976, 2.0943951023931957, 5.235987755982989, -0.7853981633974483,
+    0.3398369094541219, 1.1071487177940904, 2.718281828459045, 0.1234567891,
+]
+
+# simplify_sqrt所化简的根号内的数
+RADICANDS = [
+    2, 12, 18, 48, 75, 98, 360, 1024, 9801, 12348, 99991, 720720, 1000000, 1048576, 9999991, 123456789,
+]
+
+# 求值域的式子，(式子, 定义域)，定义域为None时在R上求
+RANGES = [
+    ("sin(x)+cos(x)", None), ("sin(2*x)+sqrt(3)*cos(2*x)+1", None), ("2*sin(x-pi/6)-1", ("0", "pi")),
+    ("sin(x)+cos(x)", ("0", "pi/2")), ("sqrt(3)*sin(-2*x)+cos(2*x)", ("-pi/3", "pi/4")), ("3*cos(5*x)+4*sin(5*x)", ("1", "2")),
+]
+
+# equ_many的左边，右边为在[-1, 1]上均匀分布的BATCH_SIZE个数（其中有特殊值）
+BATCH_LEFT = ["sin(2*x)", "cos(x)", "tan(x/3)"]
+BATCH_SIZE = 10000
+
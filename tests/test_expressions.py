@@ -0,0 +1,113 @@
+"""表达式白名单（CompiledExpr）及乘方上限（guarded_pow、ExactValue.__pow__）的回归测试
+
+$ python -m pytest tests
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import trig
+
+MODES = ["num", "trig", "wave"]
+
+ACCEPTED = [
+    ("num", "sqrt(3)/2"),
+    ("num", "-(1+2)*pi/3"),
+    ("num", "2**10"),
+    ("num", "(-2)**-2"),
+    ("num", "2**4096"),
+    ("trig", "sin(2*x/3)"),
+    ("trig", "cos(x+pi/6)"),
+    ("trig", "tan(-x)"),
+    ("wave", "sin(x)+cos(x)"),
+    ("wave", "2*sin(2*x+pi/3)"),
+    ("wave", "sqrt(2)*cos(x)-sin(x)/2"),
+]
+
+# 每种类型都必须拒绝的表达式：内置函数、属性、下划线开头的名称及各种非四则运算的语法
+REJECTED = [
+    "__import__('os')",
+    "__builtins__",
+    "_pow(2, 3)",
+    "().__class__",
+    "x.__class__",
+    "sqrt.__globals__",
+    "(1).real",
+    "open('trig.py')",
+    "eval('1')",
+    "lambda: 1",
+    "[1, 2]",
+    "{1: 2}",
+    "'sin'",
+    "b'1'",
+    "x if 1 else 2",
+    "1 < 2",
+    "sqrt(x=1)",
+    "sqrt(*[1])",
+    "(lambda: 1)()",
+    "[y for y in (1,)]",
+    "(y := 1)",
+    "sin(x)[0]",
+]
+
+TOO_LARGE = ["9**9**9", "2**4097", "10**10**10", "(2**64)**(2**64)"]
+
+
+@pytest.mark.parametrize("mode, source", ACCEPTED)
+def test_accepted(mode, source):
+    trig.compile_expr(source, mode)()
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("source", REJECTED)
+def test_rejected(mode, source):
+    with pytest.raises(ValueError):
+        trig.compile_expr(source, mode)
+
+
+@pytest.mark.parametrize("mode", ["num", "wave"])
+def test_names_of_other_modes(mode):
+    # x只在trig、wave中，a、b、c只在side中
+    with pytest.raises(ValueError):
+        trig.compile_expr("a+1", mode)
+
+
+def run_isolated(code, timeout=10):
+    """在子进程中执行code，返回其输出的各行；乘方的上限失效时计算不会结束，超时即失败而不是使测试卡住"""
+    result = subprocess.run([sys.executable, "-c", "import trig\n" + code], cwd=ROOT,
+                            capture_output=True, text=True, timeout=timeout)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.splitlines()
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("source", TOO_LARGE)
+def test_power_bound(mode, source):
+    expr = source if mode == "num" else "sin(x)*(%s)" % source
+    assert run_isolated("""
+try:
+    trig.compile_expr(%r, %r)()
+except trig.TrigError as e:
+    print(e)
+""" % (expr, mode)) == ["Error: Number too large!"]
+
+
+def test_exact_power_bound():
+    assert run_isolated("print(trig.exact_value('(1+sqrt(2))**100000'))") == ["None"]
+    assert str(trig.exact_value("(1+sqrt(2))**2")) == "3+2sqrt(2)"
+
+
+@pytest.mark.parametrize("source", TOO_LARGE)
+def test_solvers_reject_large_powers(source):
+    assert run_isolated("""
+for args in [("sin(x)", %r), ("sin(%s*x)", "1/2")]:
+    try:
+        trig.solve_equation(*args)
+    except trig.TrigError as e:
+        print(e.__class__.__name__)
+""" % (source, source)) == ["TrigError", "TrigError"]
@@ -21,140 +21,438 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-try:
-    import mpmath
-    from mpmath import fp
-except:
-    print("Module \"mpmath\" isn't installed, please use `pip install mpmath` to install it!")
-    exit()
-from fractions import Fraction
-from math import gcd
-from numbers import Number
-if __import__("sys").platform != "win32":
-    import readline
+import ast
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from functools import lru_cache
+from heapq import merge
+from itertools import chain, compress, count, islice
+from math import ceil, floor, gcd, isqrt
+from numbers import Number, Rational
+from threading import Lock, RLock
+from time import perf_counter, time_ns
+
+
+def load_mpmath():
+    """导入mpmath，仅在需要高精度或区间运算时调用"""
+    try:
+        import mpmath
+    except ImportError:
+        raise ImportError("Module \"mpmath\" isn't installed, please use `pip install mpmath` to install it!") from None
+    return mpmath
+
+
+# mpmath的精度是全局的，以某个精度计算（mpmath.workdps）时加锁，以免多个线程互相修改精度
+mpmath_lock = RLock()
+
+
+def load_numpy():
+    """导入numpy，仅在数值求解时调用"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Module \"numpy\" isn't installed, please use `pip install numpy` to install it!") from None
+    return numpy
+
+
+def almosteq(s, t, rel_eps=None, abs_eps=None):
+    """判断两数是否近似相等，与mpmath.almosteq相同"""
+    if (rel_eps is None) and (abs_eps is None):
+        rel_eps = abs_eps = 2.0 ** -49
+    elif abs_eps is None:
+        abs_eps = rel_eps
+    elif rel_eps is None:
+        rel_eps = abs_eps
+    diff = abs(s - t)
+    if diff <= abs_eps:
+        return True
+    return diff <= rel_eps * max(abs(s), abs(t))
+
+
+class Stage():
+    """计时的上下文管理器，见Profiler.stage"""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, perf_counter() - self.start)
+
+
+class NullStage():
+    """关闭计时时使用的上下文管理器，什么也不做"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+null_stage = NullStage()
+
+
+class Profiler():
+    """各阶段的计时器及计数器，默认关闭
+
+    阶段：command（整条命令）、parse（解析表达式）、special（匹配特殊解）、
+    recognize（识别数，即get_num_string未命中缓存时）、domain（寻找定义域内的解）、
+    numeric（数值求解）、cache（读写结果缓存）、precision（无法确定时以高精度重新计算）、
+    export（将定义域内的解写入文件）
+    """
+
+    def __init__(self, samples=10000):
+        self.enabled = False
+        # 每个阶段保留的用时样本数，用于计算百分位数
+        self.samples = samples
+        # 不为None时只记录事件而不汇总（用于批处理的子进程）
+        self.events = None
+        self.hooks = []
+        # 多个线程可同时记录
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.timings = {}
+        self.totals = {}
+        self.counters = {}
+
+    def stage(self, name):
+        """返回一个为某阶段计时的上下文管理器"""
+        if not self.enabled:
+            return null_stage
+        return Stage(self, name)
+
+    def record(self, name, seconds):
+        """记录某阶段的一次用时"""
+        if self.events is not None:
+            self.events.append((name, seconds, False))
+            return
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = deque(maxlen=self.samples)
+                self.totals[name] = [0, 0.0]
+            self.timings[name].append(seconds)
+            total = self.totals[name]
+            total[0] += 1
+            total[1] += seconds
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def count(self, name, n=1):
+        """增加某计数器的值"""
+        if not self.enabled:
+            return
+        if self.events is not None:
+            self.events.append((name, n, True))
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def replay(self, events):
+        """汇总其他进程记录的事件"""
+        for name, value, is_count in events:
+            if is_count:
+                with self.lock:
+                    self.counters[name] = self.counters.get(name, 0) + value
+            else:
+                self.record(name, value)
+
+    def add_hook(self, hook):
+        """添加钩子，每记录一次用时就调用hook(阶段, 秒数)，可用于转发到其他的监控系统"""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def report(self):
+        """返回各阶段用时的统计、计数器及缓存命中率"""
+        stages = {}
+        for name, (count, total) in self.totals.items():
+            samples = sorted(self.timings[name])
+            stages[name] = {"count": count, "total": total, "mean": total / count}
+            for p in [50, 90, 99]:
+                stages[name]["p%d" % p] = samples[min(len(samples) - 1, len(samples) * p // 100)]
+        caches = {}
+        infos = [("get_num_string", num_cache_info()),
+                 ("compile_expr", compile_expr.cache_info()),
+                 ("square_free", square_free.cache_info()),
+                 ("wave_range", wave_range.cache_info())]
+        if result_cache is not None:
+            infos.append(("result_cache", result_cache))
+        for name, info in infos:
+            total = info.hits + info.misses
+            caches[name] = {"hits": info.hits, "misses": info.misses,
+                            "hit_rate": info.hits / total if total else 0.0}
+        return {"stages": stages, "counters": dict(self.counters), "caches": caches}
+
+    def format_report(self):
+        """以表格的形式返回report的结果"""
+        report = self.report()
+        lines = ["%-10s %8s %11s %10s %10s %10s %10s" % ("stage", "count", "total(ms)", "mean(us)", "p50(us)", "p90(us)", "p99(us)")]
+        for name, st in report["stages"].items():
+            lines.append("%-10s %8d %11.3f %10.2f %10.2f %10.2f %10.2f" % (
+                name, st["count"], st["total"] * 1e3, st["mean"] * 1e6, st["p50"] * 1e6, st["p90"] * 1e6, st["p99"] * 1e6))
+        for name, value in report["counters"].items():
+            lines.append("counter %s: %d" % (name, value))
+        for name, info in report["caches"].items():
+            lines.append("cache %s: %d hits, %d misses (%.1f%%)" % (name, info["hits"], info["misses"], info["hit_rate"] * 100))
+        return "\n".join(lines)
+
+
+# 全局的计时器，通过stats命令或profiler.enabled开启
+profiler = Profiler()
+
+
+# 已登记的变量名，其在Combination的系数数组中的位置为下标加1（位置0为常数项）
+variable_names = []
+variable_slots = {}
+variable_lock = Lock()
+
+
+def variable_slot(name):
+    """返回变量在Combination的系数数组中的位置，未登记的变量会被登记"""
+    slot = variable_slots.get(name)
+    if slot is None:
+        with variable_lock:
+            slot = variable_slots.setdefault(name, len(variable_slots) + 1)
+            if slot > len(variable_names):
+                variable_names.append(name)
+    return slot
 
 
 class Combination():
+    """线性组合（不可变），coeff[0]为常数项，coeff[i]为第i个登记的变量的系数"""
 
-    def __init__(self, coeff):
-        # 线性组合
-        self.coeff = coeff
-        if "addend" not in self.coeff:
-            self.coeff["addend"] = 0
+    __slots__ = ("coeff", )
+
+    def __init__(self, coeff=(0, )):
+        # 去掉末尾的0，使相等的线性组合有相同的系数数组
+        coeff = tuple(coeff)
+        end = len(coeff)
+        while (end > 1) and (coeff[end - 1] == 0):
+            end -= 1
+        object.__setattr__(self, "coeff", coeff[:end] if end > 0 else (0, ))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Combination is immutable")
+
+    def __reduce__(self):
+        return (Combination, (self.coeff, ))
+
+    @staticmethod
+    def from_variable(var, k=1, addend=0):
+        """构造k * var + addend"""
+        coeff = [0] * (var.slot + 1)
+        coeff[0], coeff[-1] = addend, k
+        return Combination(coeff)
+
+    @staticmethod
+    def get_coeff(other):
+        """将数、变量及线性组合转换为系数数组，其余的返回None"""
+        if isinstance(other, Combination):
+            return other.coeff
+        elif isinstance(other, Number):
+            return (other, )
+        elif isinstance(other, Variable):
+            return Combination.from_variable(other).coeff
+
+    def combine(self, other, k):
+        """返回self + k * other"""
+        a, b = self.coeff, Combination.get_coeff(other)
+        if b is None:
+            return NotImplemented
+        if len(a) < len(b):
+            a = a + (0, ) * (len(b) - len(a))
+        return Combination([x + k * y for x, y in zip(a, b)] + list(a[len(b):]))
 
     def __add__(self, other):
-        if isinstance(other, Number):
-            self.coeff["addend"] += other
-        elif isinstance(other, Variable) and (self.coeff.get(other) is None):
-            self.coeff[other] = 1
-        elif isinstance(other, Variable) and (self.coeff.get(other) is not None):
-            self.coeff[other] += 1
-        elif isinstance(other, Combination):
-            for k, v in other.coeff.items():
-                if k in self.coeff:
-                    self.coeff[k] += v
-                else:
-                    self.coeff[k] = v
-        return self
+        return self.combine(other, 1)
 
     def __radd__(self, other):
-        return self.__add__(other)
+        return self.combine(other, 1)
 
     def __sub__(self, other):
+        return self.combine(other, -1)
+
+    def __rsub__(self, other):
+        result = self.combine(other, -1)
+        return result if result is NotImplemented else -result
+
+    def __neg__(self):
+        return Combination([-x for x in self.coeff])
+
+    def __mul__(self, other):
         if isinstance(other, Number):
-            self.coeff["addend"] -= other
-        elif isinstance(other, Combination):
-            for k, v in other.coeff.items():
-                if k in self.coeff:
-                    self.coeff[k] -= v
-                    if self.coeff[k] == 0:
-                        del self.coeff[k]
-                else:
-                    self.coeff[k] = -v
-        return self
+            return Combination([x * other for x in self.coeff])
+        return NotImplemented
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __truediv__(self, other):
+        if isinstance(other, Number):
+            return Combination([x / other for x in self.coeff])
+        return NotImplemented
+
+    def __eq__(self, other):
+        return isinstance(other, Combination) and self.coeff == other.coeff
+
+    def __hash__(self):
+        return hash(self.coeff)
+
+    @property
+    def addend(self):
+        return self.coeff[0]
+
+    def get(self, var, default=None):
+        """返回某变量的系数，系数为0时返回default"""
+        slot = var.slot
+        if (slot >= len(self.coeff)) or (self.coeff[slot] == 0):
+            return default
+        return self.coeff[slot]
+
+    def items(self):
+        """依次返回各变量及其（非零的）系数"""
+        for slot in range(1, len(self.coeff)):
+            if self.coeff[slot] != 0:
+                yield Variable(variable_names[slot - 1]), self.coeff[slot]
 
     def __repr__(self):
         result, first = "", True
-        for k, v in self.coeff.items():
-            if k != "addend":
-                result += "%s%s*%s" % ("+" if (self.coeff[k] > 0) and (not first) else "", get_num_string(v), repr(k))
+        for k, v in self.items():
+            result += "%s%s*%s" % ("+" if (v > 0) and (not first) else "", get_num_string(v), repr(k))
             first = False
-        if self.coeff["addend"] != 0:
-            result += "%s%s" % ("+" if self.coeff["addend"] > 0 else "", get_num_string(self.coeff["addend"]))
+        if self.addend != 0:
+            result += "%s%s" % ("+" if self.addend > 0 else "", get_num_string(self.addend))
         return result
 
 
 class MathItem():
+    """数学对象，同一类型、同一名称的对象只有一个实例，因此相等即为同一"""
 
-    def __init__(self):
-        self.name = ""
+    __slots__ = ("name", "hash")
+    instances = {}
+
+    def __new__(cls, name=""):
+        key = (cls, name)
+        self = MathItem.instances.get(key)
+        if self is None:
+            item = object.__new__(cls)
+            item.name = name
+            item.hash = hash(key)
+            item.setup()
+            self = MathItem.instances.setdefault(key, item)
+        return self
+
+    def setup(self):
+        """实例创建时调用"""
+        pass
 
     def __eq__(self, other):
-        return isinstance(self, other.__class__) and self.name == getattr(other, "name", "")
+        return self is other
 
     def __hash__(self):
-        return hash("%s(%s)" % (self.__class__.__name__, self.name))
+        return self.hash
+
+    def __reduce__(self):
+        return (self.__class__, (self.name, ))
 
 
 class Function(MathItem):
 
-    def __init__(self, name=""):
-        super().__init__()
-        self.name = name
-        self.args = []
+    __slots__ = ()
+
+    def __new__(cls, name=""):
+        return super().__new__(cls, name)
 
     def __call__(self, *args):
-        self.args = list(args)
-        return self
+        return Application(self, args)
+
+
+class Application():
+    """函数的调用（不可变），如sin(2*x)
+
+    Function只有一个实例，调用时总是返回新的Application，因此多个线程可同时解析表达式
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, args):
+        object.__setattr__(self, "func", func)
+        object.__setattr__(self, "args", tuple(args))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Application is immutable")
+
+    @property
+    def name(self):
+        return self.func.name
+
+    def __eq__(self, other):
+        return isinstance(other, Application) and (self.func, self.args) == (other.func, other.args)
+
+    def __hash__(self):
+        return hash((self.func, self.args))
+
+    def __reduce__(self):
+        return (Application, (self.func, self.args))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.name, ", ".join(map(repr, self.args)))
 
 
 class Variable(MathItem):
 
-    def __init__(self, name="x"):
-        super().__init__()
-        self.name = name
+    __slots__ = ("slot", )
+
+    def __new__(cls, name="x"):
+        return super().__new__(cls, name)
+
+    def setup(self):
+        # 在Combination的系数数组中的位置
+        self.slot = variable_slot(self.name)
 
     def __add__(self, other):
-        if isinstance(other, Number):
-            return Combination({self: 1, "addend": other})
-        elif isinstance(other, Variable) and self.name == other.name:
-            return Combination({self: 2})
-        else:
-           raise RuntimeError()
+        return Combination.from_variable(self) + other
 
     def __radd__(self, other):
-        return self.__add__(other)
+        return Combination.from_variable(self) + other
 
     def __sub__(self, other):
-        if isinstance(other, Number):
-            return Combination({self: 1, "addend": -other})
-        elif isinstance(other, Variable):
-            return 0
-        else:
-            raise RuntimeError()
+        return Combination.from_variable(self) - other
 
     def __rsub__(self, other):
-        if isinstance(other, Number):
-            return Combination({self: -1, "addend": other})
-        elif isinstance(other, Variable):
-            return 0
-        else:
-            raise RuntimeError()
+        return other - Combination.from_variable(self)
+
+    def __neg__(self):
+        return Combination.from_variable(self, -1)
 
     def __mul__(self, other):
         if isinstance(other, Number):
-            return Combination({self: other})
-        else:
-            raise RuntimeError()
+            return Combination.from_variable(self, other)
+        return NotImplemented
 
     def __rmul__(self, other):
         return self.__mul__(other)
 
     def __truediv__(self, other):
         if isinstance(other, Number):
-            return Combination({self: 1 / other})
-        else:
-            raise RuntimeError()
+            return Combination.from_variable(self, 1 / other)
+        return NotImplemented
 
     def __repr__(self):
         return self.name
@@ -165,15 +463,242 @@ func_cos = Function("cos")
 func_tan = Function("tan")
 
 
+class Interval():
+    """闭区间[a, b]，用于表示范围"""
+
+    __slots__ = ("a", "b")
+
+    def __init__(self, a, b):
+        self.a, self.b = (a, b) if a <= b else (b, a)
+
+    def __add__(self, other):
+        if isinstance(other, Interval):
+            return Interval(self.a + other.a, self.b + other.b)
+        elif isinstance(other, Number):
+            return Interval(self.a + other, self.b + other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        if isinstance(other, Number):
+            return Interval(self.a - other, self.b - other)
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, Number):
+            return Interval(self.a * other, self.b * other)
+        return NotImplemented
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __truediv__(self, other):
+        if isinstance(other, Number):
+            return Interval(self.a / other, self.b / other)
+        return NotImplemented
+
+    def __eq__(self, other):
+        return isinstance(other, Interval) and (self.a, self.b) == (other.a, other.b)
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __repr__(self):
+        return "[%r, %r]" % (self.a, self.b)
+
+
+def sin_range(start, end):
+    """sin在[start, end]上的值域
+
+    值域的端点只可能是区间端点处的值或±1（当区间内有sin的极值点x = π/2 + kπ时）
+    """
+    lo, hi = sorted((math.sin(start), math.sin(end)))
+    first = ceil((start - math.pi / 2) / math.pi)
+    last = floor((end - math.pi / 2) / math.pi)
+    if first <= last:
+        # k为偶数时取最大值1，为奇数时取最小值-1
+        if (first % 2 == 0) or (first < last):
+            hi = 1.0
+        if (first % 2 == 1) or (first < last):
+            lo = -1.0
+    return Interval(lo, hi)
+
+
+class Wave():
+    """a*sin(omega*x) + b*cos(omega*x) + c（不可变），用于解析求值域的式子（见parse_wave）
+
+    k不为0时为x的一次式k*x + c，只能作为sin、cos的参数；omega为0时不含sin、cos
+    """
+
+    __slots__ = ("a", "b", "c", "omega", "k")
+
+    def __init__(self, a=0.0, b=0.0, c=0.0, omega=0.0, k=0.0):
+        for name, value in zip(self.__slots__, (a, b, c, omega, k)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Wave is immutable")
+
+    @property
+    def is_constant(self):
+        return (self.omega == 0) and (self.k == 0)
+
+    def combine(self, other, s):
+        """返回self + s * other，sin、cos的频率须相同，且不能与x的一次式相加"""
+        if isinstance(other, Number):
+            other = Wave(c=other)
+        elif not isinstance(other, Wave):
+            return NotImplemented
+        omega = self.omega or other.omega
+        if self.omega and other.omega and (not almosteq(self.omega, other.omega)):
+            raise TypeError("Different frequencies")
+        if omega and (self.k or other.k):
+            raise TypeError("Not a sinusoid")
+        return Wave(self.a + s * other.a, self.b + s * other.b, self.c + s * other.c, omega, self.k + s * other.k)
+
+    def __add__(self, other):
+        return self.combine(other, 1)
+
+    def __radd__(self, other):
+        return self.combine(other, 1)
+
+    def __sub__(self, other):
+        return self.combine(other, -1)
+
+    def __rsub__(self, other):
+        result = self.combine(other, -1)
+        return result if result is NotImplemented else -result
+
+    def __neg__(self):
+        return self * -1
+
+    def __pos__(self):
+        return self
+
+    def __mul__(self, other):
+        if isinstance(other, Wave) and other.is_constant:
+            other = other.c
+        elif isinstance(other, Wave) and self.is_constant:
+            return other * self.c
+        if isinstance(other, Number):
+            return Wave(self.a * other, self.b * other, self.c * other, self.omega, self.k * other)
+        return NotImplemented
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __truediv__(self, other):
+        if isinstance(other, Wave) and other.is_constant:
+            other = other.c
+        if isinstance(other, Number):
+            return self * (1 / other)
+        return NotImplemented
+
+    def __rtruediv__(self, other):
+        if self.is_constant:
+            return other / self.c
+        return NotImplemented
+
+    def __pow__(self, other):
+        if self.is_constant:
+            return self.c ** (other.c if isinstance(other, Wave) and other.is_constant else other)
+        return NotImplemented
+
+    def __rpow__(self, other):
+        if self.is_constant:
+            return other ** self.c
+        return NotImplemented
+
+    def __repr__(self):
+        return "Wave(%r, %r, %r, %r, %r)" % (self.a, self.b, self.c, self.omega, self.k)
+
+
+def wave_arg(arg):
+    """sin、cos的参数k*x + phi，返回(k, phi)"""
+    if isinstance(arg, Number):
+        return 0, arg
+    if (not isinstance(arg, Wave)) or arg.omega:
+        raise TypeError("Not a sinusoid")
+    return arg.k, arg.c
+
+
+def wave_sin(arg):
+    """sin(k*x + phi) = sign(k) * cos(phi) * sin(|k|*x) + sin(phi) * cos(|k|*x)"""
+    k, phi = wave_arg(arg)
+    if k == 0:
+        return math.sin(phi)
+    return Wave(math.copysign(math.cos(phi), k), math.sin(phi), 0.0, abs(k))
+
+
+def wave_cos(arg):
+    """cos(k*x + phi) = -sign(k) * sin(phi) * sin(|k|*x) + cos(phi) * cos(|k|*x)"""
+    k, phi = wave_arg(arg)
+    if k == 0:
+        return math.cos(phi)
+    return Wave(-math.copysign(math.sin(phi), k), math.cos(phi), 0.0, abs(k))
+
+
+@lru_cache(maxsize=4096)
+def wave_range(a, b, c, omega, start=None, end=None):
+    """a*sin(omega*x) + b*cos(omega*x) + c在闭区间[start, end]上的值域（Interval），不给出区间时为在R上的值域
+
+    由辅助角公式化为R*sin(omega*x + phi) + c，其中R = sqrt(a**2 + b**2)、tan(phi) = b / a，
+    最值只可能在区间端点或omega*x + phi = π/2 + kπ处取到（见sin_range）；结果按系数及区间缓存
+    """
+    if omega < 0:
+        a, omega = -a, -omega
+    R, phi = math.hypot(a, b), math.atan2(b, a)
+    if start is None:
+        return Interval(b + c, b + c) if omega == 0 else Interval(c - R, c + R)
+    if start > end:
+        start, end = end, start
+    return sin_range(omega * start + phi, omega * end + phi) * R + c
+
+
+def wave_range_many(a, b, c, omega, start, end):
+    """wave_range的numpy版本：各参数可以是数组（按numpy的规则广播），返回值域的两端(lo, hi)两个数组"""
+    np = load_numpy()
+    a, b, c, omega, start, end = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (a, b, c, omega, start, end)])
+    a = np.where(omega < 0, -a, a)
+    omega = np.abs(omega)
+    R, phi = np.hypot(a, b), np.arctan2(b, a)
+    t0 = omega * np.minimum(start, end) + phi
+    t1 = omega * np.maximum(start, end) + phi
+    s0, s1 = np.sin(t0), np.sin(t1)
+    lo, hi = np.minimum(s0, s1), np.maximum(s0, s1)
+    # 同sin_range：区间内有极值点π/2 + kπ时，k为偶数取到最大值1，为奇数取到最小值-1
+    first = np.ceil((t0 - math.pi / 2) / math.pi)
+    last = np.floor((t1 - math.pi / 2) / math.pi)
+    inside, several = first <= last, first < last
+    even = np.mod(first, 2) == 0
+    hi = np.where(inside & (even | several), 1.0, hi)
+    lo = np.where(inside & ((~even) | several), -1.0, lo)
+    return lo * R + c, hi * R + c
+
+
 class Triangle():
 
-    def __init__(self, **kwargs):
-        self.args = {}
-        for i in ["a", "b", "c", "A", "B", "c", "area", "cric"]:
-            if kwargs.get(i) is None:
-                self.args[i] = None
-            else:
-                self.args[i] = kwargs[i]
+    def __init__(self, exact=None, **kwargs):
+        """
+        @param exact  已知量的精确值（ExactValue），用于求出结果的精确值，见exact_result
+        @param kwargs 已知量（浮点数）
+        """
+        self.args = dict.fromkeys(["a", "b", "c", "A", "B", "C", "area", "cric"])
+        angles = 0
+        for i, value in kwargs.items():
+            if (i not in self.args) or (value is None):
+                continue
+            self.args[i] = value
+            # 边（及面积、周长）须为正数，角须在(0, π)内
+            if (not math.isfinite(value)) or (value <= 0) or (i.isupper() and (value >= math.pi)):
+                raise TrigError("Error: Bad argument: \"%s=%s\"!" % (i, get_num_string(value)))
+            if i.isupper():
+                angles += value
+        if angles >= math.pi:
+            raise TrigError("Error: The sum of the angles must be less than π!")
+        self.exact = exact or {}
 
     def get_known_side(self):
         return [side for side in self.args.keys() if (side in ["a", "b", "c"] and self.args[side] is not None)]
@@ -194,16 +719,18 @@ class Triangle():
         """使用海伦公式求面积"""
         p = (self.args["a"] + self.args["b"] + self.args["c"]) / 2
         a, b, c = self.args["a"], self.args["b"], self.args["c"]
-        return fp.sqrt(p * (p - a) * (p - b) * (p - c))
+        if (p - a <= 0) or (p - b <= 0) or (p - c <= 0):
+            # 不满足三角形的三边关系
+            return None
+        return math.sqrt(p * (p - a) * (p - b) * (p - c))
 
     def can_use_Bb_sin(self, cond):
         for c in "abc":
-            if (c in self.args) and (c.upper() in self.args):
+            if (self.args[c] is not None) and (self.args[c.upper()] is not None):
                 if cond == "area":
                     return True
                 try:
-                    result = eval(cond, {"a": Variable("a"), "b": Variable("b"),
-                                         "c": Variable("c"), "__builtins__": None})
+                    result = trig_eval(cond, "side")
                     if isinstance(result, Combination):
                         return True
                     return False
@@ -211,38 +738,64 @@ class Triangle():
                     return False
         return False
 
+    def get_side_coeff(self, which, known_side):
+        """返回所求的线性组合中未知边的系数及已知边的贡献"""
+        coeff, offset = {}, 0
+        expr = trig_eval(which, "side")
+        for char in ["a", "b", "c"]:
+            if (value := expr.get(Variable(char))) is not None:
+                coeff[char] = value
+        if known_side in coeff:
+            offset = coeff[known_side] * self.args[known_side]
+            del coeff[known_side]
+        return coeff, offset
+
     def Bb_sin(self, which):
         """已知一边及其对角求三边的线性组合及面积的范围
 
         以下的算法都涉及了对公式的推导
         """
-        known_side = self.get_known_side()[0]
+        known_side = [side for side in self.get_known_side() if self.args[side.upper()] is not None][0]
+        if high_precision:
+            with mpmath_lock:
+                return self.Bb_sin_mp(which, known_side)
         phi = self.args[known_side.upper()]
-        double_R = self.args[known_side] / \
-            fp.sin(self.args[known_side.upper()])
+        double_R = self.args[known_side] / math.sin(phi)
         if which == "area":
-            # 求面积的范围
-            A, phi = mpmath.polar((mpmath.sin(phi) / 2) - (mpmath.cos(phi) / 2) * 1j)
-            return (mpmath.iv.sin(mpmath.iv.mpf([0, fp.pi - self.args[known_side.upper()]]) * 2 + phi) * A + mpmath.cos(self.args[known_side.upper()]) / 2) * self.args[known_side] * double_R / 2
-        coeff, offset = {}, 0
-        expr = eval(which, {"a": Variable("a"), "b": Variable("b"),
-                           "c": Variable("c"), "__builtins__": None})
-        for char in ["a", "b", "c"]:
-            if (value := expr.coeff.get(Variable(char))) is not None:
-                coeff[char] = value
-        if known_side in coeff:
-            offset = coeff[known_side] * self.args[known_side]
-            del coeff[known_side]
+            # 求面积的范围：面积为(sin(phi)*sin(x) - cos(phi)*cos(x) + cos(phi)) / 2 * b * 2R / 2，其中x ∈ [0, 2(π-phi)]
+            return wave_range(math.sin(phi) / 2, -math.cos(phi) / 2, math.cos(phi) / 2, 1.0,
+                              0.0, 2 * (math.pi - phi)) * (self.args[known_side] * double_R / 2)
+        coeff, offset = self.get_side_coeff(which, known_side)
         if len(coeff) == 1:
-            return mpmath.iv.sin([0, fp.pi - self.args[known_side.upper()]]) * double_R * list(coeff.values())[0] + offset
+            return wave_range(double_R * list(coeff.values())[0], 0.0, offset, 1.0, 0.0, math.pi - phi)
         elif len(coeff) == 2:
-            # 以下计算a*sin(x+phi)+b*sin(x)+c的值域，使用了辅助角公式
+            # 以下计算a*sin(x+phi)+b*sin(x)+c的值域，展开后即(a*cos(phi)+b)*sin(x) + a*sin(phi)*cos(x) + c
             a, b = coeff[self.get_unknown_side()[0]] * \
                 double_R, coeff[self.get_unknown_side()[1]] * double_R
-            # 复数的三角形式和辅助角公式是类似的
-            A, phi = mpmath.polar(
-                (a * mpmath.cos(phi) + b) + (a * mpmath.sin(phi)) * 1j)
-            return mpmath.iv.sin(mpmath.iv.mpf([0, fp.pi - self.args[known_side.upper()]]) + phi) * A + offset
+            return wave_range(a * math.cos(phi) + b, a * math.sin(phi), offset, 1.0, 0.0, math.pi - phi)
+
+    def Bb_sin_mp(self, which, known_side):
+        """同Bb_sin，但使用mpmath的区间运算"""
+        mpmath = load_mpmath()
+        phi = self.args[known_side.upper()]
+        double_R = self.args[known_side] / \
+            math.sin(self.args[known_side.upper()])
+        result = None
+        if which == "area":
+            A, phi = mpmath.polar((mpmath.sin(phi) / 2) - (mpmath.cos(phi) / 2) * 1j)
+            result = (mpmath.iv.sin(mpmath.iv.mpf([0, math.pi - self.args[known_side.upper()]]) * 2 + phi) * A + mpmath.cos(self.args[known_side.upper()]) / 2) * self.args[known_side] * double_R / 2
+        else:
+            coeff, offset = self.get_side_coeff(which, known_side)
+            if len(coeff) == 1:
+                result = mpmath.iv.sin([0, math.pi - self.args[known_side.upper()]]) * double_R * list(coeff.values())[0] + offset
+            elif len(coeff) == 2:
+                a, b = coeff[self.get_unknown_side()[0]] * \
+                    double_R, coeff[self.get_unknown_side()[1]] * double_R
+                A, phi = mpmath.polar(
+                    (a * mpmath.cos(phi) + b) + (a * mpmath.sin(phi)) * 1j)
+                result = mpmath.iv.sin(mpmath.iv.mpf([0, math.pi - self.args[known_side.upper()]]) + phi) * A + offset
+        if result is not None:
+            return Interval(float(result.a), float(result.b))
 
     def solve(self, which):
         if self.can_use_heron_formular(which):
@@ -250,401 +803,2837 @@ class Triangle():
         elif self.can_use_Bb_sin(which):
             return self.Bb_sin(which)
 
+    def Bb_sin_candidates(self, which):
+        """Bb_sin所求范围的端点可能取到的精确值
+
+        sin_range的端点只可能是区间端点处的值或±1，对应的各个值用已知量的精确值求出，不能精确表示的略去
+        """
+        known_side = [side for side in self.get_known_side() if self.args[side.upper()] is not None][0]
+        side, angle = self.exact.get(known_side), self.exact.get(known_side.upper())
+        if (side is None) or (angle is None):
+            return []
+        sin, cos = exact_trig("sin", angle), exact_trig("cos", angle)
+        if (sin is None) or (cos is None):
+            return []
+        double_R, result = side / sin, []
+
+        def add(f):
+            try:
+                result.append(f())
+            except (InexactError, ZeroDivisionError, ValueError):
+                pass
+
+        if which == "area":
+            # 辅助角为angle - π/2，振幅为1/2，两端点处sin的值都为-cos(angle)
+            for s in [-cos, ExactValue(1), ExactValue(-1)]:
+                add(lambda: (s + cos) / 2 * side * double_R / 2)
+            return result
+        expr = trig_eval(which, "side")
+        coeff = {char: exact_number(value) for char in "abc" if (value := expr.get(Variable(char))) is not None}
+        if None in coeff.values():
+            return []
+        offset = coeff.pop(known_side) * side if known_side in coeff else ExactValue(0)
+        if len(coeff) == 1:
+            k = list(coeff.values())[0]
+            for s in [ExactValue(0), sin, ExactValue(1)]:
+                add(lambda: s * double_R * k + offset)
+        elif len(coeff) == 2:
+            a, b = coeff[self.get_unknown_side()[0]] * double_R, coeff[self.get_unknown_side()[1]] * double_R
+            # 两端点处分别为a*sin(angle)、b*sin(angle)，极值为±sqrt(a**2+b**2+2*a*b*cos(angle))
+            add(lambda: a * sin + offset)
+            add(lambda: b * sin + offset)
+            try:
+                A = (a * a + b * b + 2 * a * b * cos).sqrt()
+            except (InexactError, ValueError):
+                return result
+            result += [offset + A, offset - A]
+        return result
+
+    def exact_result(self, which, value):
+        """solve的结果的精确值：数返回ExactValue，范围返回两端的精确值(lo, hi)，不知道的为None"""
+        if value is None:
+            return None
+        if self.can_use_heron_formular(which):
+            a, b, c = [self.exact.get(side) for side in "abc"]
+            if None in (a, b, c):
+                return None
+            try:
+                p = (a + b + c) / 2
+                return (p * (p - a) * (p - b) * (p - c)).sqrt()
+            except (InexactError, ValueError):
+                return None
+        candidates = self.Bb_sin_candidates(which)
+        return tuple(next((e for e in candidates if almosteq(e.value, v, recognize_eps)), None) for v in (value.a, value.b))
+
+
+@lru_cache(maxsize=1024)
+def triangle_exact(which, known, value):
+    """解三角形的结果value的精确值（见Triangle.exact_result），在输出时才求出，结果按(所求, 已知量, value)缓存
+
+    @param known 已知量，各项为(名称, 输入的表达式或数, 浮点数)
+    """
+    exact = {k: exact_value(v, "ang" if k in ["A", "B", "C"] else "num") if isinstance(v, str) else ExactValue.coerce(v)
+             for k, v, _ in known}
+    return Triangle(exact, **{k: f for k, _, f in known}).exact_result(which, value)
+
 
 # 定义域，通过set_var函数修改
 D = None
+# 不为None时，定义域内的解写入此文件（见export_solutions），通过set_var函数修改
+out = None
+# 求范围时是否使用mpmath的区间运算（较慢），通过set_var函数修改
+high_precision = False
+# 精度策略，通过set_var或set_precision修改：默认用浮点数计算，判断两数是否相等时，
+# 若（相对）差值在certain_eps与ambiguous_eps之间（即用浮点数无法确定），且知道该数由哪个表达式求得，
+# 则用mpmath以precision_dps位有效数字重新求值后再判断（见precise_eq）
+adaptive_precision = True
+precision_dps = 50
+certain_eps = 2.0 ** -50
+ambiguous_eps = 1e-9
+# get_num_string识别sqrt(a/b)型等无理数时的容差（不知道求得该数的表达式时）
+recognize_eps = 1e-10
 # 特殊字符
 ang_s = chr(8736)
 pi_s = chr(960)
-# 特殊的三角方程的解集
-special = {
-    "sin": {
-        -1: {"2*k%s" % pi_s: True, "-": False, fp.pi / 2: True},
-        0: {"k" + pi_s: True},
-        1: {"2*k%s" % pi_s: True, "+": False, fp.pi / 2: True}
-    },
-    "cos": {
-        -1: {"2*k%s" % pi_s: True, "+": False, fp.pi: True},
-        0: {"k%s" % pi_s: True, "+": False, fp.pi / 2: True},
-        1: {"2*k" + pi_s: True}
-    },
-    "tan": {
-        0: {"k" + pi_s: True}
-    }
-}
 # 单位圆的弧度圈，逆时针方向，从-pi/2开始
 # 为什么是-pi/2而非0呢？很简单，cos(x)>a需要纵截单位圆，这样便于程序设计，且也便于sin(x)>a的运算
-unit_circle = [
-    -fp.pi / 2,
-    -fp.pi / 3,
-    -fp.pi / 4,
-    -fp.pi / 6,
-    0,
-    fp.pi / 6,
-    fp.pi / 4,
-    fp.pi / 3,
-    fp.pi / 2,
-    2 * fp.pi / 3,
-    3 * fp.pi / 4,
-    5 * fp.pi / 6,
-    fp.pi,
-    7 * fp.pi / 6,
-    5 * fp.pi / 4,
-    4 * fp.pi / 3
-]
+# 弧度圈由[-π/2, 3π/2)内π/n的整数倍组成，n取自unit_circle_grid，通过set_unit_circle修改
+unit_circle_grid = (1, 2, 3, 4, 6)
+unit_circle = []
+# 弧度圈上各弧度的精确值(k, n)，即kπ/n
+unit_circle_exact = []
+# 弧度圈上各弧度的三角比的索引，{"s"/"c"/"t": {近似值: [(序号, 三角比, 弧度, 弧度的精确值)]}}，首次使用时建立
+trig_index = {}
+trig_index_scale = 1e8
+# 弧度圈上各弧度的三角比的精确值：exact_trig_values为{(k, n): {"s"/"c"/"t": 精确值}}（不能精确表示的为None），
+# exact_trig_index为{"s"/"c"/"t": {精确值: [(序号, 弧度的精确值)]}}，首次使用时建立（见build_exact_trig）
+exact_trig_values = {}
+exact_trig_index = {}
+# 首次使用时建立的各个查找表（trig_index、num_table、spf）在建立时加锁，其他线程不会看到建立了一半的表
+build_lock = Lock()
 
 
-def simplify_sqrt(value):
-    """化简根式
+def set_unit_circle(*grid):
+    """设置弧度圈
 
-    @param value 根号内的正整数
+    @param grid 弧度圈由π/n（n取自grid）的整数倍组成
     """
-    i, result = 2, []
-    while True:
-        if value == i:
-            result.append(i)
+    global unit_circle_grid
+    angles = set()
+    for n in grid:
+        n = int(n)
+        if n <= 0:
+            raise ValueError("The denominator must be positive")
+        for k in range(-n // 2, 3 * n // 2 + 1):
+            if -n <= 2 * k < 3 * n:
+                g = gcd(k, n)
+                angles.add((k // g, n // g))
+    with build_lock:
+        unit_circle_grid = tuple(int(n) for n in grid)
+        unit_circle_exact[:] = sorted(angles, key=lambda item: item[0] / item[1])
+        unit_circle[:] = [k * math.pi / n for k, n in unit_circle_exact]
+        trig_index.clear()
+        exact_trig_values.clear()
+        exact_trig_index.clear()
+    triangle_exact.cache_clear()
+
+
+def build_trig_index():
+    """建立弧度圈上各弧度的三角比的索引"""
+    with build_lock:
+        if trig_index:
+            return
+        indexes = {}
+        for name, f in [("s", math.sin), ("c", math.cos), ("t", math.tan)]:
+            index = indexes.setdefault(name, {})
+            for i, angle in enumerate(unit_circle):
+                value = f(angle)
+                index.setdefault(round(value * trig_index_scale), []).append((i, value, angle, ExactValue(*unit_circle_exact[i], pi=True)))
+        trig_index.update(indexes)
+
+
+set_unit_circle(*unit_circle_grid)
+
+
+# 最小质因数表（spf[n]为n的最小质因数），首次使用时建立，按需扩大
+spf = array("I")
+# 最小质因数表的最大长度，更大的数使用表内的质数试除
+spf_max = 1 << 20
+
+
+def build_spf(n):
+    """建立n以内的最小质因数表"""
+    global spf
+    with build_lock:
+        if len(spf) > n:
+            return
+        spf = sieve_spf(max(n, 2 * len(spf), 1 << 12))
+
+
+def sieve_spf(n):
+    """筛出n以内的最小质因数表"""
+    is_prime = bytearray([1]) * (isqrt(n) + 1)
+    table = array("I", range(n + 1))
+    primes = []
+    for i in range(2, isqrt(n) + 1):
+        if is_prime[i]:
+            primes.append(i)
+            is_prime[i * i::i] = bytes(len(range(i * i, len(is_prime), i)))
+    # 从大到小填写，使较小的质因数覆盖较大的
+    for p in reversed(primes):
+        table[p * p::p] = array("I", [p]) * len(range(p * p, n + 1, p))
+    return table
+
+
+# 超出最小质因数表的数先用trial_max以内的质数试除，首次使用时筛出
+trial_max = 1 << 16
+trial_primes = []
+
+
+def get_trial_primes():
+    global trial_primes
+    if not trial_primes:
+        sieve = bytearray([1]) * (trial_max + 1)
+        sieve[:2] = b"\0\0"
+        for i in range(2, isqrt(trial_max) + 1):
+            if sieve[i]:
+                sieve[i * i::i] = bytes(len(range(i * i, trial_max + 1, i)))
+        trial_primes = list(compress(range(trial_max + 1), sieve))
+    return trial_primes
+
+
+# Miller-Rabin素性检验的底，n < 3.3*10**24时结果是确定的
+prime_bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+
+def is_prime(n):
+    """Miller-Rabin素性检验"""
+    if n < 2:
+        return False
+    for p in prime_bases:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for a in prime_bases:
+        x = pow(a, d, n)
+        if (x == 1) or (x == n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_rho(n):
+    """用Pollard ρ算法（Brent的改进）找出奇合数n的一个非平凡因数"""
+    for c in count(1):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while (k < r) and (g == 1):
+                ys = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += 128
+            r *= 2
+        if g == n:
+            # 一批中累乘到了n，逐步回溯
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def factorize(n):
+    """分解质因数，返回{质数: 次数}
+
+    表内的数直接查最小质因数表；更大的数先用小质数试除，剩下的部分（已没有trial_max以内的质因数）
+    用Miller-Rabin检验是否为质数，不是时用Pollard ρ算法分解
+    """
+    if len(spf) <= min(n, spf_max):
+        build_spf(min(n, spf_max))
+    # 其他线程可能同时换上更大的表
+    table = spf
+    result = {}
+    if n >= len(table):
+        for p in get_trial_primes():
+            if (p * p > n) or (n < len(table)):
+                break
+            while n % p == 0:
+                result[p] = result.get(p, 0) + 1
+                n //= p
+        if n >= len(table):
+            rest = [n]
+            while rest:
+                m = rest.pop()
+                if is_prime(m):
+                    result[m] = result.get(m, 0) + 1
+                else:
+                    d = pollard_rho(m)
+                    rest += [d, m // d]
+            return result
+    while n > 1:
+        p = table[n]
+        result[p] = result.get(p, 0) + 1
+        n //= p
+    return result
+
+
+@lru_cache(maxsize=4096)
+def square_free(n):
+    """将正整数n分解为outter**2 * inner，其中inner不含平方因子"""
+    inner, outter = 1, 1
+    for p, e in factorize(n).items():
+        outter *= p ** (e // 2)
+        if e % 2 == 1:
+            inner *= p
+    return outter, inner
+
+
+def simplify_sqrt(value):
+    """化简根式
+
+    @param value 根号内的正整数
+    """
+    outter, inner = square_free(value)
+    return "%ssqrt(%d)" % ("" if outter == 1 else outter, inner)
+
+
+def format_pi(a, b, always_p=False):
+    """将aπ/b表示为字符串"""
+    if b == 1:
+        return "%s%s" % (a if abs(a) != 1 else str(a).replace("1", ""), pi_s)
+    if (not always_p) and almosteq((a + 1) / b, 2):
+        return "-%s/%s" % (pi_s, b)
+    return "%s%s/%s" % (a if abs(a) != 1 else str(a).replace("1", ""), pi_s, b)
+
+
+def format_frac(a, b):
+    """将a/b表示为字符串"""
+    return "%s%s%s" % (a, "/" if b != 1 else "", "" if b == 1 else b)
+
+
+def format_surd(p, q, r, d):
+    """将(p+q*sqrt(r))/d表示为字符串"""
+    term = "%ssqrt(%d)" % ("" if abs(q) == 1 else abs(q), r)
+    if p == 0:
+        return "%s%s%s" % ("-" if q < 0 else "", term, "" if d == 1 else "/%d" % d)
+    s = "%d%s%s" % (p, "+" if q > 0 else "-", term)
+    return s if d == 1 else "(%s)/%d" % (s, d)
+
+
+class InexactError(ArithmeticError):
+    """运算的结果不能用ExactValue表示（如sqrt(2)+sqrt(3)、π+1）"""
+
+
+class ExactValue():
+    """精确值：有理数p/d、弧度pπ/d或(p+q*sqrt(r))/d（r不含平方因子）
+
+    由输入的表达式直接求出（见exact_value），或由浮点数识别得到（见identify）。
+    可以进行四则运算，结果不能表示时抛出InexactError；value为其浮点数值（首次访问时求出）
+
+    @param p, d  分子（或其中的有理数部分）、分母，d为正
+    @param q, r  根式部分q*sqrt(r)，q为0时没有根式
+    @param pi    是否为pπ/d
+    """
+
+    __slots__ = ("p", "q", "r", "d", "pi", "value")
+
+    def __init__(self, p, d=1, q=0, r=1, pi=False):
+        if r == 1:
+            p, q = p + q, 0
+        if q == 0:
+            r = 1
+            # 0不必表示为0π
+            pi = pi and (p != 0)
+        if d < 0:
+            p, q, d = -p, -q, -d
+        g = gcd(p, q, d)
+        if g != 1:
+            p, q, d = p // g, q // g, d // g
+        self.p, self.q, self.r, self.d, self.pi = p, q, r, d, pi
+
+    def __getattr__(self, name):
+        # value未求出时才会调用，运算的中间结果不必求出浮点数值
+        if name != "value":
+            raise AttributeError(name)
+        if self.pi:
+            self.value = self.p * math.pi / self.d
+        else:
+            self.value = (self.p + self.q * math.sqrt(self.r)) / self.d
+        return self.value
+
+    @property
+    def kind(self):
+        """类型（"zero"、"frac"、"pi"、"sqrt"之一）"""
+        if self.pi:
+            return "pi"
+        if self.q != 0:
+            return "sqrt"
+        return "frac" if self.p != 0 else "zero"
+
+    def format(self, always_p=False):
+        """表示为字符串，always_p见get_num_string"""
+        if self.pi:
+            return format_pi(self.p, self.d, always_p)
+        if self.q == 0:
+            return format_frac(self.p, self.d)
+        return format_surd(self.p, self.q, self.r, self.d)
+
+    def mp(self, mpmath):
+        """以mpmath求出的高精度值，可作为precise_eq的exact_mp"""
+        if self.pi:
+            return mpmath.pi * self.p / self.d
+        return (self.p + self.q * mpmath.sqrt(self.r)) / mpmath.mpf(self.d)
+
+    def matches(self, value, source=None, eps=None):
+        """value是否等于该精确值：给出eps且不知道source时按容差eps比较，否则见precise_eq"""
+        if (eps is None) or (source is not None):
+            return precise_eq(value, self.value, source, exact_mp=self.mp)
+        return almosteq(value, self.value, eps)
+
+    def to_dict(self):
+        return {"kind": self.kind, "p": self.p, "q": self.q, "r": self.r, "d": self.d,
+                "value": self.value, "text": self.format()}
+
+    def __float__(self):
+        return self.value
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return "ExactValue(%s)" % self.format()
+
+    def __eq__(self, other):
+        if isinstance(other, int):
+            return self.is_rational and (self.d == 1) and (self.p == other)
+        if not isinstance(other, ExactValue):
+            return NotImplemented
+        return (self.p, self.q, self.r, self.d, self.pi) == (other.p, other.q, other.r, other.d, other.pi)
+
+    def __hash__(self):
+        # 整数与相等的int有相同的哈希值
+        if self.is_rational and (self.d == 1):
+            return hash(self.p)
+        return hash((self.p, self.q, self.r, self.d, self.pi))
+
+    def __bool__(self):
+        return (self.p != 0) or (self.q != 0)
+
+    @property
+    def is_rational(self):
+        return (self.q == 0) and (not self.pi)
+
+    @staticmethod
+    def coerce(other):
+        """将整数、分数转换为ExactValue，其余的（包括浮点数）返回None"""
+        if isinstance(other, ExactValue):
+            return other
+        if isinstance(other, int):
+            return ExactValue(other)
+        if isinstance(other, Rational):
+            return ExactValue(int(other.numerator), int(other.denominator))
+        return None
+
+    def __add__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        if not other:
+            return self
+        if not self:
+            return other
+        if self.pi or other.pi:
+            if not (self.pi and other.pi):
+                raise InexactError("Cannot add %s and %s exactly" % (self, other))
+            return ExactValue(self.p * other.d + other.p * self.d, self.d * other.d, pi=True)
+        if (self.q != 0) and (other.q != 0) and (self.r != other.r):
+            raise InexactError("Cannot add %s and %s exactly" % (self, other))
+        return ExactValue(self.p * other.d + other.p * self.d, self.d * other.d,
+                          self.q * other.d + other.q * self.d, self.r if self.q != 0 else other.r)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return ExactValue(-self.p, self.d, -self.q, self.r, self.pi)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return -self if self.value < 0 else self
+
+    def __sub__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        return self + (-other)
+
+    def __rsub__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        return other + (-self)
+
+    def __mul__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        if self.is_rational:
+            self, other = other, self
+        if other.is_rational:
+            # 乘以有理数（最常见的情况，如除以x的系数）
+            if other.p == other.d:
+                return self
+            return ExactValue(self.p * other.p, self.d * other.d, self.q * other.p, self.r, self.pi)
+        if (not self) or (not other):
+            return ExactValue(0)
+        if self.pi or other.pi:
+            if (self.pi and other.pi) or (self.q != 0) or (other.q != 0):
+                raise InexactError("Cannot multiply %s and %s exactly" % (self, other))
+            return ExactValue(self.p * other.p, self.d * other.d, pi=True)
+        if (self.q == 0) or (other.q == 0) or (self.r == other.r):
+            r = self.r if self.q != 0 else other.r
+            return ExactValue(self.p * other.p + self.q * other.q * r, self.d * other.d,
+                              self.p * other.q + other.p * self.q, r)
+        if (self.p == 0) and (other.p == 0):
+            outter, inner = square_free(self.r * other.r)
+            return ExactValue(0, self.d * other.d, self.q * other.q * outter, inner)
+        raise InexactError("Cannot multiply %s and %s exactly" % (self, other))
+
+    __rmul__ = __mul__
+
+    def reciprocal(self):
+        """1/self，(p+q*sqrt(r))/d的倒数为d*(p-q*sqrt(r))/(p**2-q**2*r)"""
+        if not self:
+            raise ZeroDivisionError("division by zero")
+        if self.pi:
+            raise InexactError("Cannot invert %s exactly" % self)
+        return ExactValue(self.d * self.p, self.p * self.p - self.q * self.q * self.r, -self.d * self.q, self.r)
+
+    def __truediv__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        if other.pi and (self.pi or not self):
+            if not other:
+                raise ZeroDivisionError("division by zero")
+            # 两个弧度之比为有理数
+            return ExactValue(self.p * other.d, self.d * other.p)
+        if other.is_rational and other:
+            return self * ExactValue(other.d, other.p)
+        return self * other.reciprocal()
+
+    def __rtruediv__(self, other):
+        if (other := ExactValue.coerce(other)) is None:
+            return NotImplemented
+        return other / self
+
+    def __pow__(self, n):
+        if isinstance(n, ExactValue) and n.is_rational:
+            n = n.p if n.d == 1 else (n.p, n.d)
+        if n == (1, 2):
+            return self.sqrt()
+        if (not isinstance(n, int)) or (abs(n) > 64) or \
+                (abs(n) * max(abs(self.p), abs(self.q), self.d).bit_length() > pow_max_bits):
+            raise InexactError("Cannot raise %s to %s exactly" % (self, n))
+        result, base = ExactValue(1), (self if n >= 0 else self.reciprocal())
+        for _ in range(abs(n)):
+            result = result * base
+        return result
+
+    def sqrt(self):
+        """平方根，只能对非负的有理数求出（p*d须小于spf_max**2，以便完全分解质因数）"""
+        if not self.is_rational:
+            raise InexactError("Cannot take the square root of %s exactly" % self)
+        if self.p < 0:
+            raise ValueError("math domain error")
+        if self.p * self.d >= spf_max ** 2:
+            raise InexactError("Cannot take the square root of %s exactly" % self)
+        outter, inner = square_free(self.p * self.d)
+        return ExactValue(0, self.d, outter, inner)
+
+
+# 特殊的三角方程的解集（弧度为ExactValue）
+special = {
+    "sin": {
+        -1: {"2*k%s" % pi_s: True, "-": False, ExactValue(1, 2, pi=True): True},
+        0: {"k" + pi_s: True},
+        1: {"2*k%s" % pi_s: True, "+": False, ExactValue(1, 2, pi=True): True}
+    },
+    "cos": {
+        -1: {"2*k%s" % pi_s: True, "+": False, ExactValue(1, pi=True): True},
+        0: {"k%s" % pi_s: True, "+": False, ExactValue(1, 2, pi=True): True},
+        1: {"2*k" + pi_s: True}
+    },
+    "tan": {
+        0: {"k" + pi_s: True}
+    }
+}
+
+
+# 常见的数（aπ/b、a*sqrt(c)/b）的查找表，首次使用时建立
+num_table = {}
+num_table_scale = 1e8
+
+
+def build_num_table():
+    """建立常见数的查找表，键为数值的近似值，值为ExactValue的列表"""
+    with build_lock:
+        if num_table:
+            return
+        num_table.update(num_table_items())
+
+
+def num_table_items():
+    items, table = [], {}
+    for b in range(1, 13):
+        for a in range(-4 * b, 4 * b + 1):
+            if (a != 0) and (gcd(a, b) == 1):
+                items.append(ExactValue(a, b, pi=True))
+    for c in [1, 2, 3, 5, 6, 7]:
+        for b in range(1, 13):
+            for a in range(1, 13):
+                if gcd(a, b) == 1:
+                    items.append(ExactValue(0, b, a, c))
+                    items.append(ExactValue(0, b, -a, c))
+    for item in items:
+        table.setdefault(round(item.value * num_table_scale), []).append(item)
+    return table
+
+
+def lookup_num_table(value, source=None):
+    """在查找表中寻找某数的精确值，找不到时返回None"""
+    if not num_table:
+        build_num_table()
+    for exact in num_table.get(round(value * num_table_scale), []):
+        if exact.matches(value, source):
+            return exact
+
+
+# identify所识别的数的分母（以及根号内的数）的上限，以及循环连分数的最长周期，通过set_identify修改
+identify_max_den = 10000
+identify_max_period = 8
+
+
+def continued_fraction(x, max_den=None):
+    """x的连分数展开
+
+    展开到渐近分数与x只差几个ulp（此后的项已不可靠）或分母超过max_den为止，返回(各项, 最后的渐近分数)
+    """
+    terms = []
+    h0, h1, k0, k1 = 0, 1, 1, 0
+    eps = 2.0 ** -50 * abs(x)
+    y = x
+    # 浮点数的误差可能使展开永不终止（如落入循环），而64项的渐近分数的分母早已远超浮点数的精度
+    for _ in range(64):
+        a = floor(y)
+        h0, h1 = h1, a * h1 + h0
+        k0, k1 = k1, a * k1 + k0
+        if (max_den is not None) and (k1 > max_den):
+            return terms, (h0, k0)
+        terms.append(a)
+        f = y - a
+        if (abs(x - h1 / k1) <= eps) or (f < 2.0 ** -60):
+            break
+        y = 1 / f
+    return terms, (h1, k1)
+
+
+def match_rational(x, terms, max_den, eps):
+    """在x的渐近分数（由连分数的各项terms求出）中寻找与x相差不超过eps的h/k（k不超过max_den），找不到时返回None"""
+    h0, h1, k0, k1 = 0, 1, 1, 0
+    for a in terms:
+        h0, h1 = h1, a * h1 + h0
+        k0, k1 = k1, a * k1 + k0
+        if k1 > max_den:
+            return None
+        if abs(x - h1 / k1) <= eps:
+            return h1, k1
+    return None
+
+
+def periodic_surd(terms, max_period, max_disc):
+    """若连分数的各项（去掉可能不可靠的最后一项）从某项起循环（至少出现两个周期），求出其精确值
+
+    返回(p, q, D, d)，即(p+q*sqrt(D))/d，其中D为循环部分所满足的二次方程的判别式（不超过max_disc），找不到时返回None
+    """
+    terms = terms[:-1]
+    n = len(terms)
+    for t in range(1, min(max_period, (n - 1) // 2) + 1):
+        if terms[n - 2 * t:n - t] == terms[n - t:]:
+            break
+    else:
+        return None
+    s = n - 2 * t
+    while (s > 1) and (terms[s - 1] == terms[s - 1 + t]):
+        s -= 1
+    # 纯循环的部分y满足y = (P*y+P')/(Q*y+Q')，即Q*y**2+(Q'-P)*y-P' = 0
+    P, P1, Q, Q1 = 1, 0, 0, 1
+    for a in terms[s:s + t]:
+        P, P1, Q, Q1 = a * P + P1, P, a * Q + Q1, Q
+    u, D, v = P - Q1, (Q1 - P) ** 2 + 4 * Q * P1, 2 * Q
+    if D > max_disc:
+        return None
+    # x = (A*y+A')/(B*y+B')，代入y = (u+sqrt(D))/v后分母有理化
+    A, A1, B, B1 = 1, 0, 0, 1
+    for a in terms[:s]:
+        A, A1, B, B1 = a * A + A1, A, a * B + B1, B
+    alpha, beta = A * u + A1 * v, B * u + B1 * v
+    return alpha * beta - A * B * D, A * beta - alpha * B, D, beta * beta - B * B * D
+
+
+def identify_num(value, source=None):
+    """通过连分数识别某数，见identify
+
+    x的连分数只展开一次，既可找出有理数（有限连分数），也可找出(p+q*sqrt(r))/d（循环连分数）；
+    另外x/π的连分数用于识别弧度，x**2的连分数用于识别循环周期较长的sqrt(a/b)
+    """
+    max_den = identify_max_den
+    eps = ambiguous_eps * max(1.0, abs(value))
+    terms, _ = continued_fraction(value)
+    found = match_rational(value, terms, max_den, eps)
+    if found is not None:
+        exact = ExactValue(*found)
+        if exact.matches(value, source):
+            return exact
+    x = value / math.pi
+    found = match_rational(x, continued_fraction(x, max_den)[0], max_den, eps / math.pi)
+    if found is not None:
+        exact = ExactValue(*found, pi=True)
+        if exact.matches(value, source):
+            return exact
+    # 由于计算机算术的误差（平方后误差更大），不得不设置一个较大的容差
+    x = value * value
+    found = match_rational(x, continued_fraction(x, max_den)[0], max_den, max(recognize_eps, ambiguous_eps) * x)
+    if found is not None:
+        # sqrt(a/b) = oa*ob*sqrt(ia*ib)/b，a、b互质，故ia*ib不含平方因子
+        (oa, ia), (ob, ib) = square_free(found[0]), square_free(found[1])
+        if ia * ib <= max_den:
+            exact = ExactValue(0, found[1], oa * ob if value > 0 else -oa * ob, ia * ib)
+            if exact.matches(value, source, recognize_eps):
+                return exact
+    surd = periodic_surd(terms, identify_max_period, max_den * max_den)
+    if surd is not None:
+        p, q, D, d = surd
+        outter, inner = square_free(D)
+        exact = ExactValue(p, d, q * outter, inner)
+        if (exact.d <= max_den) and (exact.r <= max_den) and exact.matches(value, source, recognize_eps):
+            return exact
+
+
+def identify(value, source=None):
+    """识别某数的精确形式，返回ExactValue，无法识别时返回None
+
+    依次识别0、常见数的查找表、有理数、弧度aπ/b、sqrt(a/b)及(p+q*sqrt(r))/d，分母不超过identify_max_den
+
+    @param value  某浮点数
+    @param source 求得value的表达式（输入的数），用于在无法确定时以高精度判断，见precise_eq
+    """
+    if not math.isfinite(value):
+        return None
+    if precise_eq(value, 0, source):
+        return ExactValue(0)
+    exact = lookup_num_table(value, source)
+    if exact is None:
+        exact = identify_num(value, source)
+    return exact
+
+
+def cached_num_string(value, always_p=False, source=None):
+    with profiler.stage("recognize"):
+        exact = identify(value, source)
+        return str(value) if exact is None else exact.format(always_p)
+
+
+# get_num_string（及identify_cached）的缓存大小，通过set_num_cache_size修改
+num_cache_size = 4096
+get_num_string_cached = lru_cache(maxsize=num_cache_size)(cached_num_string)
+identify_cached = lru_cache(maxsize=num_cache_size)(identify)
+
+
+def set_num_cache_size(size):
+    """修改get_num_string及identify_cached的缓存大小（同时清空缓存）"""
+    global num_cache_size, get_num_string_cached, identify_cached
+    num_cache_size = size
+    get_num_string_cached = lru_cache(maxsize=size)(cached_num_string)
+    identify_cached = lru_cache(maxsize=size)(identify)
+    # 三角形的结果的精确值也与识别的容差及范围有关
+    triangle_exact.cache_clear()
+
+
+def num_cache_info():
+    """返回get_num_string的缓存命中情况(hits, misses, maxsize, currsize)"""
+    return get_num_string_cached.cache_info()
+
+
+def get_num_string(value, always_p=False, source=None):
+    """返回一些有理数/无理数的分式表示：
+
+    1. 弧度
+    2. 分子、分母都为整数的分数
+    3. sqrt(a)/b及(p+q*sqrt(r))/d型的数
+
+    结果会被缓存，未命中缓存时由identify识别，无法识别时返回str(value)
+
+    @param value      某浮点数
+    @param always_p   返回的弧度是否为正（在弧度值本身为正的情况下），若为True则返回5π/3而非-π/3
+    @param source     求得value的表达式（输入的数），用于在无法确定时以高精度判断，见precise_eq
+    """
+    return get_num_string_cached(value, always_p, source)
+
+
+def format_exact(exact, value, always_p=False, source=None):
+    """精确值exact的字符串表示；exact为None或超出识别范围（分母或根号内的数超过identify_max_den）时识别value，
+    见get_num_string
+    """
+    if (exact is not None) and (exact.d <= identify_max_den) and (exact.r <= identify_max_den):
+        return exact.format(always_p)
+    return get_num_string(value, always_p, source)
+
+
+def divide_exact(exact, coeff):
+    """exact / coeff，任一个为None或结果不能精确表示时返回None"""
+    if (exact is None) or (coeff is None):
+        return None
+    try:
+        return exact / coeff
+    except (InexactError, ZeroDivisionError):
+        return None
+
+
+def exact_number(value):
+    """将整数或等于某个分数（分母不超过identify_max_den）的浮点数转换为ExactValue，否则返回None"""
+    from fractions import Fraction
+    if isinstance(value, int):
+        return ExactValue(value)
+    frac = Fraction(value).limit_denominator(identify_max_den)
+    return ExactValue(frac.numerator, frac.denominator) if float(frac) == value else None
+
+
+def trig_mp(name, k, n):
+    """返回以mpmath求出kπ/n的三角比的函数，作为precise_eq的exact_mp"""
+    return lambda mpmath: getattr(mpmath, {"s": "sin", "c": "cos", "t": "tan"}[name])(mpmath.pi * k / n)
+
+
+def get_trig(name, value, source=None, exact=None):
+    """返回一个三角比的值对应的弧度（一般情况下是两个），各项为[弧度的精确值, 弧度]
+
+    @param name   三角比的名称（"s", "c", "t"）
+    @param value  三角比的值
+    @param source 求得value的表达式，用于在无法确定时以高精度判断，见precise_eq
+    @param exact  value的精确值（ExactValue），给出时直接查exact_trig_index
+    """
+    if exact is not None:
+        if not exact_trig_index:
+            build_exact_trig()
+        if found := exact_trig_index.get(name[0], {}).get(exact):
+            return [[angle, unit_circle[i]] for i, angle in found]
+    if not math.isfinite(value):
+        return []
+    if not trig_index:
+        build_trig_index()
+    index, key = trig_index[name[0]], round(value * trig_index_scale)
+    found = []
+    # 近似值可能恰好落在相邻的格子里
+    for k in (key - 1, key, key + 1):
+        for item in index.get(k, ()):
+            # 明显相等或不相等的（绝大多数）不必交给precise_eq
+            diff, scale = abs(value - item[1]), max(1.0, abs(item[1]))
+            if diff <= certain_eps * scale:
+                found.append(item)
+            elif (diff <= ambiguous_eps * scale) and \
+                    precise_eq(value, item[1], source, exact_mp=trig_mp(name[0], *unit_circle_exact[item[0]])):
+                found.append(item)
+    return [[exact, angle] for i, value, angle, exact in sorted(found)]
+
+
+def build_exact_trig():
+    """识别弧度圈上各弧度的三角比，建立exact_trig_values及exact_trig_index
+
+    识别出的精确值须与三角比只差舍入误差（远小于识别时的容差），否则视为不能精确表示
+    """
+    # 识别时会用到其他查找表（同样在build_lock下建立），因此先在锁外求出
+    angles, values, index = list(unit_circle_exact), {}, {"s": {}, "c": {}, "t": {}}
+    for i, (k, n) in enumerate(angles):
+        row, angle = values.setdefault((k, n), {}), ExactValue(k, n, pi=True)
+        for name, f in [("sin", math.sin), ("cos", math.cos), ("tan", math.tan)]:
+            if (name == "tan") and (n == 2):
+                # tan(kπ/2)（k为奇数）不存在
+                row[name[0]] = None
+                continue
+            value = f(k * math.pi / n)
+            exact = identify(value)
+            if (exact is not None) and (not almosteq(exact.value, value, 2.0 ** -40)):
+                exact = None
+            row[name[0]] = exact
+            if exact is not None:
+                index[name[0]].setdefault(exact, []).append((i, angle))
+    with build_lock:
+        # 建立期间弧度圈被修改时放弃
+        if (not exact_trig_index) and (angles == unit_circle_exact):
+            exact_trig_values.update(values)
+            exact_trig_index.update(index)
+
+
+def exact_trig(name, angle):
+    """三角比的精确值，angle（ExactValue）不在弧度圈上或结果不能精确表示时返回None"""
+    if angle.pi:
+        k, n = angle.p, angle.d
+    elif not angle:
+        k, n = 0, 1
+    else:
+        return None
+    # 化到[-1/2, 3/2)内，即弧度圈的范围[-π/2, 3π/2)
+    k -= 2 * n * ((2 * k + n) // (4 * n))
+    if not exact_trig_index:
+        build_exact_trig()
+    row = exact_trig_values.get((k, n))
+    return None if row is None else row[name[0]]
+
+
+def exact_inverse(name, value):
+    """反三角函数的精确值（主值），value（ExactValue）不是弧度圈上的三角比时返回None
+
+    @param name 三角函数或反三角函数的名称（"sin"与"asin"相同）
+    """
+    if not exact_trig_index:
+        build_exact_trig()
+    name = name[1:] if name.startswith("a") else name
+    for i, angle in exact_trig_index.get(name[0], {}).get(value, []):
+        k, n = angle.p, angle.d
+        # 主值区间：asin为[-π/2, π/2]，acos为[0, π]，atan为(-π/2, π/2)
+        if ((name == "sin") and (-n <= 2 * k <= n)) or ((name == "cos") and (0 <= k <= n)) or \
+                ((name == "tan") and (-n < 2 * k < n)):
+            return angle
+    return None
+
+
+# 整数的乘方结果超过这么多位时拒绝计算（如9**9**9），浮点数的最大值也只有1024位
+pow_max_bits = 4096
+
+
+def guarded_pow(base, exp):
+    """表达式中的乘方（见GuardedPow）：两个整数的乘方结果过大时抛出TrigError，而不是长时间计算"""
+    if (type(base) is int) and (type(exp) is int) and (exp > 0) and \
+            (exp * (abs(base).bit_length() - 1) > pow_max_bits):
+        raise TrigError("Error: Number too large!")
+    return base ** exp
+
+
+class GuardedPow(ast.NodeTransformer):
+    """将表达式中的a ** b替换为_pow(a, b)，即guarded_pow"""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            func = ast.copy_location(ast.Name("_pow", ast.Load()), node)
+            return ast.copy_location(ast.Call(func, [node.left, node.right], []), node)
+        return node
+
+
+# 各种类型的表达式中允许使用的函数及变量（以_开头的是内部使用的，不能在表达式中出现）
+namespaces = {
+    "trig": {"sin": func_sin, "cos": func_cos, "tan": func_tan,
+             "sqrt": math.sqrt, "pi": math.pi, "x": Variable()},
+    "num": {"sqrt": math.sqrt, "pi": math.pi},
+    "ang": {"asin": math.asin, "acos": math.acos, "atan": math.atan, "pi": math.pi},
+    "side": {"a": Variable("a"), "b": Variable("b"), "c": Variable("c")},
+    "wave": {"sin": wave_sin, "cos": wave_cos, "sqrt": math.sqrt, "pi": math.pi, "x": Wave(k=1.0)}
+}
+for namespace in namespaces.values():
+    namespace["__builtins__"] = {}
+    namespace["_pow"] = guarded_pow
+# 表达式中允许出现的语法（即四则运算、乘方、函数调用）
+allowed_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+                 ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+class CompiledExpr():
+    """经过检查并编译的表达式，可多次求值"""
+
+    __slots__ = ("source", "mode", "code", "mp_code")
+
+    def __init__(self, source, mode):
+        self.source = source
+        self.mode = mode
+        self.mp_code = None
+        if mode not in namespaces:
+            raise ValueError("Unknown expression type \"%s\"" % mode)
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError("Invalid expression \"%s\"" % source) from None
+        has_pow = False
+        for node in ast.walk(tree):
+            has_pow = has_pow or isinstance(node, ast.Pow)
+            if not isinstance(node, allowed_nodes):
+                raise ValueError("Unsupported syntax in \"%s\"" % source)
+            if isinstance(node, ast.Constant) and ((not isinstance(node.value, (int, float))) or isinstance(node.value, bool)):
+                raise ValueError("Unsupported constant in \"%s\"" % source)
+            if isinstance(node, ast.Name) and ((node.id not in namespaces[mode]) or node.id.startswith("_")):
+                raise ValueError("Unknown name \"%s\"" % node.id)
+            if isinstance(node, ast.Call) and ((not isinstance(node.func, ast.Name)) or node.keywords):
+                raise ValueError("Unsupported call in \"%s\"" % source)
+        self.code = compile(GuardedPow().visit(tree) if has_pow else tree, "<trig>", "eval")
+
+    def __call__(self, namespace=None):
+        """求值
+
+        @param namespace 替换默认的函数及变量
+        """
+        return eval(self.code, namespaces[self.mode] if namespace is None else namespace)
+
+    def mp_value(self, mpmath):
+        """用mpmath以当前的精度求值，式中的常数先转换为mpf（因此1/3不会先算成浮点数）"""
+        if self.mp_code is None:
+            tree = MpfConstants().visit(ast.parse(self.source.strip(), mode="eval"))
+            self.mp_code = compile(ast.fix_missing_locations(tree), "<trig>", "eval")
+        return eval(self.mp_code, {"sqrt": mpmath.sqrt, "pi": +mpmath.pi, "asin": mpmath.asin, "acos": mpmath.acos,
+                                   "atan": mpmath.atan, "mpf": mpmath.mpf, "__builtins__": {}})
+
+    def exact_value(self, names=None):
+        """求精确值（ExactValue），不能精确表示时抛出InexactError，见eval_exact
+
+        @param names 表达式中的变量的值（如{"x": ExactValue(1)}）
+        """
+        return eval_exact(ast.parse(self.source.strip(), mode="eval").body, names or {})
+
+    def __repr__(self):
+        return "CompiledExpr(%r, %r)" % (self.source, self.mode)
+
+
+def eval_exact(node, names):
+    """用ExactValue对（已经过检查的）语法树求值
+
+    小数按其十进制值转换为分数，分母超过identify_max_den时（如0.70710678）视为近似值，
+    与不能精确表示的结果（如sqrt(2)+sqrt(3)、asin(1/3)）一样抛出InexactError
+    """
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, int):
+            return ExactValue(node.value)
+        from fractions import Fraction
+        value = Fraction(repr(node.value))
+        if value.denominator > identify_max_den:
+            raise InexactError("%r is an approximation" % node.value)
+        return ExactValue(value.numerator, value.denominator)
+    if isinstance(node, ast.Name):
+        if node.id == "pi":
+            return ExactValue(1, pi=True)
+        if node.id in names:
+            return names[node.id]
+    elif isinstance(node, ast.UnaryOp):
+        value = eval_exact(node.operand, names)
+        return -value if isinstance(node.op, ast.USub) else value
+    elif isinstance(node, ast.BinOp):
+        left, right = eval_exact(node.left, names), eval_exact(node.right, names)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        elif isinstance(node.op, ast.Sub):
+            return left - right
+        elif isinstance(node.op, ast.Mult):
+            return left * right
+        elif isinstance(node.op, ast.Div):
+            return left / right
+        elif isinstance(node.op, ast.Pow):
+            return left ** right
+    elif isinstance(node, ast.Call) and (len(node.args) == 1):
+        value = eval_exact(node.args[0], names)
+        if node.func.id == "sqrt":
+            return value.sqrt()
+        if node.func.id in ("asin", "acos", "atan"):
+            if (angle := exact_inverse(node.func.id, value)) is not None:
+                return angle
+    raise InexactError("Cannot evaluate \"%s\" exactly" % ast.unparse(node))
+
+
+class MpfConstants(ast.NodeTransformer):
+    """将表达式中的常数c替换为mpf("c")"""
+
+    def visit_Constant(self, node):
+        return ast.Call(ast.Name("mpf", ast.Load()), [ast.Constant(repr(node.value))], [])
+
+
+@lru_cache(maxsize=256)
+def mp_value(source, mode, dps):
+    """以dps位有效数字求表达式的值"""
+    mpmath = load_mpmath()
+    with mpmath_lock, mpmath.workdps(dps):
+        return compile_expr(source, mode).mp_value(mpmath)
+
+
+def precise_eq(value, exact, source=None, mode="num", exact_mp=None):
+    """判断由表达式source求得的value是否等于精确值exact
+
+    差值不超过certain_eps或超过ambiguous_eps时直接得出结果；落在两者之间时用浮点数无法确定，
+    若给出了source且开启了adaptive_precision，用mpmath以precision_dps位有效数字重新求值后判断，否则同almosteq
+
+    @param exact_mp 以mpmath为参数、返回exact的高精度值的函数，默认为mpf(exact)
+    """
+    diff = abs(value - exact)
+    # inf、nan与任何数都不相等（否则inf - x <= certain_eps * inf成立）
+    if not math.isfinite(diff):
+        return False
+    scale = max(1.0, abs(value), abs(exact))
+    # 只差几个ulp时视为相等（浮点数的运算本身就有这么大的误差）
+    if diff <= certain_eps * scale:
+        return True
+    if diff > ambiguous_eps * scale:
+        return False
+    if (source is None) or (not adaptive_precision):
+        return almosteq(value, exact)
+    try:
+        mpmath = load_mpmath()
+    except ImportError:
+        return almosteq(value, exact)
+    profiler.count("precision.escalations")
+    with profiler.stage("precision"), mpmath_lock, mpmath.workdps(precision_dps):
+        v = mp_value(source.strip(), mode, precision_dps)
+        e = mpmath.mpf(exact) if exact_mp is None else exact_mp(mpmath)
+        return abs(v - e) <= mpmath.mpf(10) ** (10 - precision_dps) * max(1, abs(e))
+
+
+@lru_cache(maxsize=1024)
+def compile_expr(s, mode="num"):
+    """解析并编译表达式，结果按(s, mode)缓存
+
+    @param s    某表达式
+    @param mode 何种类型（"trig", "num", "ang", "side", "wave"）
+    """
+    return CompiledExpr(s, mode)
+
+
+@lru_cache(maxsize=1024)
+def exact_value(source, mode="num"):
+    """表达式的精确值（ExactValue），不能精确表示时返回None，结果按(source, mode)缓存"""
+    try:
+        return compile_expr(source, mode).exact_value()
+    except (InexactError, ZeroDivisionError, ValueError, OverflowError):
+        return None
+
+
+@lru_cache(maxsize=1024)
+def exact_coeff(source, coeff):
+    """最简三角函数（如sin(2*x/3)）中x的系数的精确值，不能精确表示时返回None
+
+    函数的参数是x的倍数（见is_simplest），因此系数即x = 1时参数的值
+
+    @param source 左边的表达式
+    @param coeff  求得的系数（浮点数），用于检验
+    """
+    if source in ("s", "c", "t"):
+        return ExactValue(1)
+    node = ast.parse(source.strip(), mode="eval").body
+    if (not isinstance(node, ast.Call)) or (len(node.args) != 1):
+        return None
+    try:
+        exact = eval_exact(node.args[0], {"x": ExactValue(1)})
+    except (InexactError, ZeroDivisionError, ValueError, OverflowError):
+        return None
+    return exact if almosteq(exact.value, coeff) else None
+
+
+def trig_eval(s, cond="num"):
+    """解析输入的表达式
+
+    @param s    某表达式
+    @param cond 何种类型
+    """
+    with profiler.stage("parse"):
+        if cond == "trig":
+            if s == "s":
+                return func_sin(Variable())
+            elif s == "c":
+                return func_cos(Variable())
+            elif s == "t":
+                return func_tan(Variable())
+        return compile_expr(s, cond)()
+
+
+def get_coeff_and_addend(left):
+    if isinstance(left.args[0], Variable):
+        return 1
+    return left.args[0].get(Variable())
+
+
+def build_sol(expr, x_coeff, exact_coeff=None):
+    """根据x的系数和最简方程的解构建最终解
+
+    @param expr        包含解和一些控制标志的字典，解可以是ExactValue
+    @param x_coeff     x的系数
+    @param exact_coeff x的系数的精确值，给出时解直接用精确值相除
+    """
+    result = []
+    for item, action in expr.items():
+        if action == False:
+            result.append(item)
+        else:
+            if isinstance(item, ExactValue):
+                result.append(format_exact(divide_exact(item, exact_coeff), item.value / x_coeff))
+            elif isinstance(item, Number):
+                result.append(get_num_string(item / x_coeff))
+            else:
+                if "*" in item:
+                    coeff, item = item.split("*")
+                else:
+                    coeff = 1
+                k = divide_exact(ExactValue(int(coeff)), exact_coeff)
+                if (k is not None) and k.is_rational:
+                    a, b = k.p, k.d
+                else:
+                    from fractions import Fraction
+                    a, b = Fraction(float(coeff) / x_coeff).limit_denominator(1000).as_integer_ratio()
+                result.append("%s%s%s%s" % (a if abs(a) != 1 else str(a).replace("1", ""), item,
+                                            "/" if b != 1 else "", "" if b == 1 else b))
+    return " ".join(result)
+
+
+def is_simplest(expr):
+    if not isinstance(expr, Application):
+        raise RuntimeError()
+    if isinstance(expr.args[0], Variable):
+        return True
+    if expr.args[0].get(Variable()) is None:
+        return False
+    if expr.args[0].addend == 0:
+        return True
+    return False
+
+
+def get_families(name, sol, coeff):
+    """返回通解所对应的等差数列，解集为x = offset + k * period
+
+    @param name  三角函数的名称
+    @param sol   最简方程的主值解
+    @param coeff x的系数
+    """
+    if name == "sin":
+        # kπ + (-1)^k * sol按k的奇偶拆分为两组
+        offsets, period = [sol, math.pi - sol], 2 * math.pi
+    elif name == "cos":
+        offsets, period = [sol, -sol], 2 * math.pi
+    elif name == "tan":
+        offsets, period = [sol], math.pi
+    return [offset / coeff for offset in offsets], abs(period / coeff)
+
+
+def solve_in_domain(offsets, period, domain):
+    """直接由周期及定义域求出k的范围，返回定义域内从小到大排列的解
+
+    @param offsets 各组解的初值
+    @param period  周期
+    @param domain  定义域（闭区间）
+    """
+    start, end = domain
+    # 容许少许误差，以免端点上的解因计算误差而丢失
+    eps = 1e-9
+    groups = []
+    for offset in offsets:
+        first = ceil((start - offset) / period - eps)
+        last = floor((end - offset) / period + eps)
+        groups.append([offset + k * period for k in range(first, last + 1)])
+    result = []
+    for x in merge(*groups):
+        if (len(result) == 0) or (x - result[-1] > eps * period):
+            result.append(x)
+    return result
+
+
+def export_domain_solutions(offsets, period, domain, path, chunk=1 << 20):
+    """同solve_in_domain，但将解从小到大直接写入文件，内存占用只与chunk有关，返回解的个数
+
+    @param path  .npy文件，或其他后缀名的文件（依次存放的float64）
+    @param chunk 每次计算、写入的解的个数
+    """
+    np = load_numpy()
+    start, end = domain
+    eps = 1e-9
+    # 各组解的周期相同，将初值化到[0, period)中并去掉重复的组，之后每个周期内的解依次为r[0] < r[1] < ...
+    normalized = sorted(offset - floor(offset / period) * period for offset in offsets)
+    normalized = sorted(x - period if x > period * (1 - eps) else x for x in normalized)
+    r = []
+    for x in normalized:
+        if (not r) or (x - r[-1] > eps * period):
+            r.append(x)
+    r = np.array(r)
+    first = np.array([ceil((start - x) / period - eps) for x in r])
+    last = np.array([floor((end - x) / period + eps) for x in r])
+    total = int(np.maximum(last - first + 1, 0).sum())
+    if path.endswith(".npy"):
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(total,))
+    elif total == 0:
+        open(path, "wb").close()
+        return 0
+    else:
+        output = np.memmap(path, dtype=np.float64, mode="w+", shape=(total,))
+    rows = max(1, chunk // len(r))
+    written = 0
+    with profiler.stage("export"):
+        for k0 in range(int(first.min()), int(last.max()) + 1, rows):
+            k = np.arange(k0, min(k0 + rows, int(last.max()) + 1))[:, None]
+            values = (r[None, :] + k * period)[(k >= first[None, :]) & (k <= last[None, :])]
+            output[written:written + len(values)] = values
+            written += len(values)
+    output.flush()
+    del output
+    profiler.count("export.solutions", total)
+    return total
+
+
+class SolutionFile():
+    """export_domain_solutions写出的解，数值通过内存映射读取，精确形式只在需要时生成"""
+
+    def __init__(self, path):
+        np = load_numpy()
+        self.path = path
+        if path.endswith(".npy"):
+            self.values = np.load(path, mmap_mode="r")
+        elif os.path.getsize(path) == 0:
+            self.values = np.zeros(0)
+        else:
+            self.values = np.memmap(path, dtype=np.float64, mode="r")
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def render(self, start=0, stop=None):
+        """第start至stop个解的精确形式（字符串的列表）"""
+        return [get_num_string(float(x), True) for x in self.values[start:stop]]
+
+    def __repr__(self):
+        return "SolutionFile(%r)" % self.path
+
+
+def export_solutions(solution, path, chunk=1 << 20):
+    """将EquationSolution在定义域内的解写入文件（见export_domain_solutions），返回SolutionFile"""
+    if solution.domain is None:
+        raise TrigError("Error: The domain is not set!")
+    export_domain_solutions([f.offset for f in solution.families], solution.families[0].period,
+                            solution.domain, path, chunk)
+    return SolutionFile(path)
+
+
+class TrigError(ValueError):
+    """求解时出现的错误，其信息即为交互模式下输出的内容"""
+    pass
+
+
+@lru_cache(maxsize=1024)
+def format_k_term(n, k="k"):
+    """将周期nπ表示为通解中的项，如2kπ、kπ/3"""
+    from fractions import Fraction
+    a, b = Fraction(n).limit_denominator(1000).as_integer_ratio()
+    return "%s%s%s%s%s" % (a if abs(a) != 1 else str(a).replace("1", ""), k, pi_s,
+                           "/" if b != 1 else "", "" if b == 1 else b)
+
+
+def format_offset(value, exact=None):
+    """将通解中的常数项表示为字符串，如+π/6、-π/3，为0时返回空字符串
+
+    @param exact value的精确值，见format_exact
+    """
+    if almosteq(value, 0):
+        return ""
+    return "%s%s" % ("+" if value > 0 else "", format_exact(exact, value, True))
+
+
+class Family():
+    """通解中的一组解x = offset + k * period"""
+
+    __slots__ = ("offset", "period")
+
+    def __init__(self, offset, period):
+        self.offset = offset
+        self.period = period
+
+    def to_dict(self):
+        return {"offset": self.offset, "period": self.period}
+
+    def __repr__(self):
+        return "Family(%r, %r)" % (self.offset, self.period)
+
+
+class EquationSolution():
+    """三角方程的解
+
+    数值（families、solutions）在求解时或首次访问时得到，字符串表示只在调用str时生成：
+    知道精确值时直接格式化，否则识别各个数
+    """
+
+    def __init__(self, name, coeff, value, sol, special_sol=None, domain=None, exact=None, exact_coeff=None):
+        self.name = name
+        self.coeff = coeff
+        self.value = value
+        # 最简方程的主值解
+        self.sol = sol
+        # 特殊解（special中的项），不是特殊解时为None
+        self.special_sol = special_sol
+        offsets, period = get_families(name, sol, coeff)
+        self.families = [Family(offset, period) for offset in offsets]
+        self.domain = domain
+        # 值、x的系数及主值解的精确值（ExactValue），不知道时为None
+        self.exact = exact
+        self.exact_coeff = exact_coeff
+        self.exact_sol = None if exact is None else exact_inverse(name, exact)
+        # 输入的值（表达式），见precise_eq
+        self.source = None
+        self._form = None
+        self._solutions = None
+        self._text = None
+        # 结果缓存中的键，见ResultCache
+        self.cache_key = None
+
+    @classmethod
+    def from_dict(cls, d, text=None):
+        """由to_dict的结果重建"""
+        name, value = d["function"], d["value"]
+        solution = cls(name, d["coeff"], value, inverse_funcs[name](value), find_special(name, value), d["domain"])
+        solution._solutions = d["solutions"]
+        solution._text = text
+        return solution
+
+    @property
+    def solutions(self):
+        """定义域内从小到大排列的解，没有定义域时为None"""
+        if (self._solutions is None) and (self.domain is not None):
+            with profiler.stage("domain"):
+                self._solutions = solve_in_domain([f.offset for f in self.families],
+                                                  self.families[0].period, self.domain)
+            profiler.count("domain.solutions", len(self._solutions))
+        return self._solutions
+
+    @property
+    def form(self):
+        """通解的表示方法："special"（特殊解）、"pi"（用弧度表示）或"inverse"（用反三角函数表示）"""
+        if self._form is None:
+            if self.exact_sol is None:
+                # 值不是弧度圈上的三角比（或不知道其精确值）时，识别主值解
+                exact = identify_cached(self.sol)
+                if (exact is not None) and exact.pi:
+                    self.exact_sol = exact
+            if self.special_sol is not None:
+                self._form = "special"
+            else:
+                self._form = "pi" if self.exact_sol is not None else "inverse"
+        return self._form
+
+    def general_text(self):
+        """通解的字符串表示"""
+        sol, val, coeff, exact = self.sol, self.value, self.coeff, self.exact
+        form = self.form
+        if form == "special":
+            return "x = %s" % build_sol(self.special_sol, coeff, self.exact_coeff)
+        if form == "inverse":
+            # 不能用弧度表示时，使用反三角表示
+            source = self.source
+            if (source is not None) and (val < 0) and (self.name != "cos"):
+                source = "-(%s)" % source
+            if self.name == "sin":
+                sol_s = "asin(%s)" % format_exact(None if exact is None else abs(exact), abs(val), source=source)
+            elif self.name == "cos":
+                sol_s = "acos(%s)" % format_exact(exact, val, source=source)
+            elif self.name == "tan":
+                sol_s = "atan(%s)" % format_exact(None if exact is None else abs(exact), abs(val), source=source)
+        else:
+            sol_s = self.exact_sol if self.name == "cos" else abs(self.exact_sol)
+        if self.name == "sin":
+            return "x = " + build_sol({
+                "k%s" % pi_s: True,
+                "+" if sol > 0 else "-": False,
+                "(-1)**k": False,
+                "*": False,
+                sol_s: True
+            }, coeff, self.exact_coeff)
+        elif self.name == "cos":
+            return "x = " + build_sol({
+                "2*k%s" % pi_s: True,
+                chr(177): False,
+                sol_s: True,
+            }, coeff, self.exact_coeff)
+        elif self.name == "tan":
+            return "x = " + build_sol({
+                "k%s" % pi_s: True,
+                "+" if sol > 0 else "-": False,
+                sol_s: True,
+            }, coeff, self.exact_coeff)
+
+    def exact_families(self):
+        """各组解的精确值[(offset, period)]（同get_families），不能精确表示时返回None"""
+        sol = self.exact_sol
+        if sol is None:
+            return None
+        if self.name == "sin":
+            offsets, period = [sol, ExactValue(1, pi=True) - sol], ExactValue(2, pi=True)
+        elif self.name == "cos":
+            offsets, period = [sol, -sol], ExactValue(2, pi=True)
+        else:
+            offsets, period = [sol], ExactValue(1, pi=True)
+        offsets, period = [divide_exact(offset, self.exact_coeff) for offset in offsets], divide_exact(period, self.exact_coeff)
+        if (period is None) or (None in offsets):
+            return None
+        return [(offset, abs(period)) for offset in offsets]
+
+    def domain_text(self):
+        """定义域内的解的字符串表示，反三角表示的解不列出
+
+        知道各组解的精确值时，每个解x = offset + k * period直接由k求出精确值
+        """
+        if (self.domain is None) or (self.form == "inverse"):
+            return None
+        families, result = self.exact_families(), []
+        for x in self.solutions:
+            exact = None
+            for offset, period in families or []:
+                k = round((x - offset.value) / period.value)
+                if almosteq(offset.value + k * period.value, x):
+                    exact = offset + period * k
+                    break
+            result.append(format_exact(exact, x, True))
+        return "Solution in D: {%s}" % ", ".join(result)
+
+    def __str__(self):
+        if self._text is None:
+            lines = [self.general_text()]
+            if (domain := self.domain_text()) is not None:
+                lines.append(domain)
+            self._text = "\n".join(lines)
+        return self._text
+
+    def to_dict(self):
+        return {"type": "equation", "function": self.name, "coeff": self.coeff, "value": self.value,
+                "families": [f.to_dict() for f in self.families],
+                "domain": self.domain, "solutions": self.solutions}
+
+
+class NumericSolution():
+    """不是最简方程时，在定义域内用数值方法求出的解"""
+
+    def __init__(self, expr, value, domain, solutions):
+        self.expr = expr
+        self.value = value
+        self.domain = domain
+        self.solutions = solutions
+        self._text = None
+        self.cache_key = None
+
+    def general_text(self):
+        return None
+
+    def domain_text(self):
+        return "Solution in D: {%s}" % ", ".join([get_num_string(x, True) for x in self.solutions])
+
+    def __str__(self):
+        if self._text is None:
+            self._text = self.domain_text()
+        return self._text
+
+    def to_dict(self):
+        return {"type": "equation", "method": "numeric", "expr": self.expr, "value": self.value,
+                "domain": self.domain, "solutions": self.solutions}
+
+
+class EquationBatch():
+    """equ_many的结果：左边相同的一批最简三角方程的解，各列为numpy数组
+
+    第i个方程的通解为x = offsets[i, j] + k * period[i]（sin、cos有两组解，tan只有一组），
+    form[i]为通解的表示方法（equation_forms中的序号，无解时为-1），
+    exact[i]为主值解在exact_forms中的序号（不能用弧度表示时为-1）
+    """
+
+    def __init__(self, name, coeff, values, sols, offsets, period, form, exact, exact_forms, domain=None):
+        self.name = name
+        self.coeff = coeff
+        self.values = values
+        # 各方程的主值解
+        self.sols = sols
+        self.offsets = offsets
+        self.period = period
+        self.form = form
+        self.exact = exact
+        # 主值解的精确值（ExactValue），由exact列引用
+        self.exact_forms = exact_forms
+        self.domain = domain
+        self._solutions = None
+
+    @property
+    def solutions(self):
+        """定义域内的解(solutions, starts)：第i个方程的解为solutions[starts[i]:starts[i + 1]]，没有定义域时为None"""
+        if (self.domain is None) or (self._solutions is not None):
+            return self._solutions
+        np = load_numpy()
+        with profiler.stage("domain"):
+            start, end = self.domain
+            # 同solve_in_domain，容许少许误差
+            eps = 1e-9
+            n, m = self.offsets.shape
+            period = self.period[:, None]
+            # 各组的初值化到[0, period)内并排序后，按k、组的顺序排列的解即是从小到大的
+            r = np.sort(np.mod(self.offsets, period), axis=1)
+            valid = np.isfinite(r).all(axis=1)
+            r[~valid] = 0.0
+            first = np.ceil((start - r[:, -1]) / self.period - eps)
+            last = np.floor((end - r[:, 0]) / self.period + eps)
+            counts = np.where(valid, np.maximum(last - first + 1, 0), 0).astype(np.int64)
+            rows = np.repeat(np.arange(n), counts)
+            ks = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            x = (r[rows] + (ks * self.period[rows])[:, None]).ravel()
+            rows = np.repeat(rows, m)
+            inside = ((x - start) / self.period[rows] >= -eps) & ((end - x) / self.period[rows] >= -eps)
+            rows, x = rows[inside], x[inside]
+            keep = np.ones(len(x), dtype=bool)
+            keep[1:] = (rows[1:] != rows[:-1]) | (x[1:] - x[:-1] > eps * self.period[rows[1:]])
+            rows, x = rows[keep], x[keep]
+            starts = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=n), out=starts[1:])
+        profiler.count("domain.solutions", len(x))
+        self._solutions = (x, starts)
+        return self._solutions
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        """第i个方程的解（EquationSolution），无解时抛出TrigError"""
+        if self.form[i] < 0:
+            raise TrigError("Error: Invalid right value!")
+        value = float(self.values[i])
+        solution = EquationSolution(self.name, self.coeff, value, float(self.sols[i]),
+                                    find_special(self.name, value), self.domain)
+        if self.exact[i] >= 0:
+            solution.exact_sol = self.exact_forms[self.exact[i]]
+        if self.domain is not None:
+            x, starts = self.solutions
+            solution._solutions = x[starts[i]:starts[i + 1]].tolist()
+        return solution
+
+    def to_dict(self):
+        return {"type": "equations", "function": self.name, "coeff": self.coeff, "values": self.values.tolist(),
+                "offsets": self.offsets.tolist(), "period": self.period.tolist(),
+                "form": [equation_forms[f] if f >= 0 else None for f in self.form.tolist()],
+                "exact": [self.exact_forms[e].to_dict() if e >= 0 else None for e in self.exact.tolist()],
+                "domain": self.domain}
+
+
+class IntervalSet():
+    """由若干个互不相交的区间组成的集合，区间按从小到大的顺序存放
+
+    端点存放在两个array中，端点是否闭合存放在bytearray中（1为左端闭合，2为右端闭合）；
+    插入时与相交或相接的区间合并，判断某数是否在集合中用二分查找
+    """
+
+    __slots__ = ("lo", "hi", "closed")
+
+    def __init__(self, intervals=()):
+        self.lo = array("d")
+        self.hi = array("d")
+        self.closed = bytearray()
+        for interval in intervals:
+            self.add(*interval)
+
+    def add(self, lo, hi, lo_closed=False, hi_closed=False):
+        """插入区间，与相交或相接的区间合并"""
+        if (lo > hi) or ((lo == hi) and not (lo_closed and hi_closed)):
+            return
+        n = len(self.lo)
+        # 第一个右端点不在lo左边的区间
+        i = bisect_left(self.hi, lo)
+        if (i < n) and (self.hi[i] == lo) and not (lo_closed or self.closed[i] & 2):
+            i += 1
+        j = i
+        while (j < n) and ((self.lo[j] < hi) or ((self.lo[j] == hi) and (hi_closed or self.closed[j] & 1))):
+            if (self.lo[j] < lo) or (self.lo[j] == lo):
+                lo_closed = (self.lo[j] < lo and bool(self.closed[j] & 1)) or \
+                    (self.lo[j] == lo and (lo_closed or bool(self.closed[j] & 1)))
+                lo = self.lo[j]
+            if (self.hi[j] > hi) or (self.hi[j] == hi):
+                hi_closed = (self.hi[j] > hi and bool(self.closed[j] & 2)) or \
+                    (self.hi[j] == hi and (hi_closed or bool(self.closed[j] & 2)))
+                hi = self.hi[j]
+            j += 1
+        self.lo[i:j] = array("d", [lo])
+        self.hi[i:j] = array("d", [hi])
+        self.closed[i:j] = bytes([lo_closed | hi_closed << 1])
+
+    def __contains__(self, x):
+        i = bisect_right(self.lo, x) - 1
+        if i < 0:
+            return False
+        if (x == self.lo[i]) and not self.closed[i] & 1:
+            return False
+        return (x < self.hi[i]) or ((x == self.hi[i]) and bool(self.closed[i] & 2))
+
+    def __iter__(self):
+        """依次给出(lo, hi, lo_closed, hi_closed)"""
+        for lo, hi, closed in zip(self.lo, self.hi, self.closed):
+            yield lo, hi, bool(closed & 1), bool(closed & 2)
+
+    def __len__(self):
+        return len(self.lo)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and (self.lo, self.hi, self.closed) == (other.lo, other.hi, other.closed)
+
+    def union(self, other):
+        """并集，两个集合都已有序，只需归并一次"""
+        result = IntervalSet()
+        for interval in merge(self, other):
+            # 归并后各区间按左端点排列，只可能与最后一个区间合并
+            result.add(*interval)
+        return result
+
+    def intersection(self, other):
+        """交集，用两个指针同时扫描两个集合"""
+        result = IntervalSet()
+        a, b = list(self), list(other)
+        i = j = 0
+        while (i < len(a)) and (j < len(b)):
+            lo1, hi1, lc1, hc1 = a[i]
+            lo2, hi2, lc2, hc2 = b[j]
+            if lo1 > lo2:
+                lo, lo_closed = lo1, lc1
+            elif lo1 < lo2:
+                lo, lo_closed = lo2, lc2
+            else:
+                lo, lo_closed = lo1, lc1 and lc2
+            if hi1 < hi2:
+                hi, hi_closed = hi1, hc1
+            elif hi1 > hi2:
+                hi, hi_closed = hi2, hc2
+            else:
+                hi, hi_closed = hi1, hc1 and hc2
+            result.add(lo, hi, lo_closed, hi_closed)
+            if (hi1 < hi2) or ((hi1 == hi2) and not hc1):
+                i += 1
+            else:
+                j += 1
+        return result
+
+    def __str__(self):
+        if not len(self.lo):
+            return chr(8709)
+        items = []
+        for lo, hi, lc, hc in self:
+            if lo == hi:
+                # 只有一个点
+                items.append("{%s}" % get_num_string(lo, True))
+            else:
+                items.append("%s%s, %s%s" % ("[" if lc else "(", get_num_string(lo, True),
+                                             get_num_string(hi, True), "]" if hc else ")"))
+        return (" %s " % chr(8746)).join(items)
+
+    def __repr__(self):
+        return "IntervalSet(%r)" % list(self)
+
+    def to_dict(self):
+        return [{"lo": lo, "hi": hi, "lo_closed": lc, "hi_closed": hc} for lo, hi, lc, hc in self]
+
+
+class PeriodicInterval():
+    """以period为周期的一组区间(lo + k * period, hi + k * period)，lo_closed、hi_closed表示端点是否闭合，
+    exact_lo、exact_hi为端点的精确值（ExactValue，不知道时为None）
+    """
+
+    __slots__ = ("lo", "hi", "period", "lo_closed", "hi_closed", "exact_lo", "exact_hi")
+
+    def __init__(self, lo, hi, period, lo_closed=False, hi_closed=False, exact_lo=None, exact_hi=None):
+        self.lo = lo
+        self.hi = hi
+        self.period = period
+        self.lo_closed = lo_closed
+        self.hi_closed = hi_closed
+        self.exact_lo = exact_lo
+        self.exact_hi = exact_hi
+
+    def scale(self, coeff, exact_coeff=None):
+        """将关于t的区间转换为关于x的区间，其中t = coeff * x
+
+        @param exact_coeff coeff的精确值，给出时端点的精确值也随之转换
+        """
+        lo, hi = divide_exact(self.exact_lo, exact_coeff), divide_exact(self.exact_hi, exact_coeff)
+        if coeff > 0:
+            return PeriodicInterval(self.lo / coeff, self.hi / coeff, self.period / coeff, self.lo_closed, self.hi_closed, lo, hi)
+        return PeriodicInterval(self.hi / coeff, self.lo / coeff, self.period / -coeff, self.hi_closed, self.lo_closed, hi, lo)
+
+    def within(self, domain):
+        """定义域（闭区间[s, e]）内的部分，返回IntervalSet"""
+        s, e = domain
+        result = IntervalSet()
+        # 相邻两个区间首尾相接（如sin(x) <= 1）时，端点直接取上一个区间的右端点，以免因舍入误差而分开
+        touching = almosteq(self.hi - self.lo, self.period)
+        prev_hi = None
+        for k in range(ceil((s - self.hi) / self.period), floor((e - self.lo) / self.period) + 1):
+            lo, hi = self.lo + k * self.period, self.hi + k * self.period
+            lo_closed, hi_closed = self.lo_closed, self.hi_closed
+            if touching and (prev_hi is not None):
+                lo = prev_hi
+            prev_hi = hi
+            # 端点与定义域的端点只相差舍入误差时视为相等
+            for bound in [s, e]:
+                if almosteq(lo, bound):
+                    lo = bound
+                if almosteq(hi, bound):
+                    hi = bound
+            if lo < s:
+                lo, lo_closed = s, True
+            if hi > e:
+                hi, hi_closed = e, True
+            result.add(lo, hi, lo_closed, hi_closed)
+        return result
+
+    def __contains__(self, x):
+        k = floor((x - self.lo) / self.period)
+        x = x - k * self.period
+        return ((self.lo < x) or (self.lo_closed and almosteq(x, self.lo))) and \
+            ((x < self.hi) or (self.hi_closed and almosteq(x, self.hi)))
+
+    def __str__(self):
+        k = format_k_term(self.period / math.pi)
+        return "%s%s%s, %s%s%s" % ("[" if self.lo_closed else "(", k, format_offset(self.lo, self.exact_lo),
+                                   k, format_offset(self.hi, self.exact_hi), "]" if self.hi_closed else ")")
+
+    def to_dict(self):
+        return {"lo": self.lo, "hi": self.hi, "period": self.period,
+                "lo_closed": self.lo_closed, "hi_closed": self.hi_closed}
+
+
+class InequalitySolution():
+    """三角不等式的解，字符串表示只在调用str时生成"""
+
+    def __init__(self, name, coeff, value, op, interval, domain=None):
+        self.name = name
+        self.coeff = coeff
+        self.value = value
+        self.op = op
+        self.interval = interval
+        self.domain = domain
+        self._solutions = None
+        self._text = None
+        self.cache_key = None
+
+    @classmethod
+    def from_dict(cls, d, text=None):
+        solution = cls(d["function"], d["coeff"], d["value"], d["op"], PeriodicInterval(**d["interval"]), d["domain"])
+        if d["solutions"] is not None:
+            solution._solutions = IntervalSet([(i["lo"], i["hi"], i["lo_closed"], i["hi_closed"]) for i in d["solutions"]])
+        solution._text = text
+        return solution
+
+    @property
+    def solutions(self):
+        """定义域内的解集（IntervalSet），没有定义域时为None"""
+        if (self._solutions is None) and (self.domain is not None):
+            with profiler.stage("domain"):
+                self._solutions = self.interval.within(self.domain)
+            profiler.count("domain.intervals", len(self._solutions))
+        return self._solutions
+
+    def domain_text(self):
+        if self.domain is None:
+            return None
+        return "Solution in D: %s" % self.solutions
+
+    def __str__(self):
+        if self._text is None:
+            lines = [str(self.interval)]
+            if (domain := self.domain_text()) is not None:
+                lines.append(domain)
+            self._text = "\n".join(lines)
+        return self._text
+
+    def to_dict(self):
+        return {"type": "inequality", "function": self.name, "coeff": self.coeff, "value": self.value,
+                "op": self.op, "interval": self.interval.to_dict(), "domain": self.domain,
+                "solutions": None if self.solutions is None else self.solutions.to_dict()}
+
+
+class RangeSolution():
+    """a*sin(omega*x) + b*cos(omega*x) + c的值域（Interval），给出定义域时为定义域内的值域"""
+
+    def __init__(self, expr, coeff, domain, value):
+        self.expr = expr
+        self.coeff = coeff
+        self.domain = domain
+        self.value = value
+        self._text = None
+        self.cache_key = None
+
+    @classmethod
+    def from_dict(cls, d, text=None):
+        solution = cls(d["expr"], tuple(d["coeff"]), d["domain"], Interval(d["value"]["min"], d["value"]["max"]))
+        solution._text = text
+        return solution
+
+    def __str__(self):
+        if self._text is None:
+            text = "[%s, %s]" % (get_num_string(float(self.value.a)), get_num_string(float(self.value.b)))
+            self._text = text if self.domain is None else "Range in D: %s" % text
+        return self._text
+
+    def to_dict(self):
+        return {"type": "range", "expr": self.expr, "coeff": list(self.coeff), "domain": self.domain,
+                "value": {"min": self.value.a, "max": self.value.b}}
+
+
+class TriangleSolution():
+    """三角形的解：一个数、一个范围（Interval）或None（无法求解）
+
+    exact为其精确值（数为ExactValue，范围为两端的精确值），给出known（见triangle_exact）时在调用str时才求出，
+    不知道的识别
+    """
+
+    def __init__(self, which, value, exact=None, known=None):
+        self.which = which
+        self.value = value
+        self.exact = exact
+        self.known = known
+        self._text = None
+        self.cache_key = None
+
+    @classmethod
+    def from_dict(cls, d, text=None):
+        value = d["value"]
+        if isinstance(value, dict):
+            value = Interval(value["min"], value["max"])
+        solution = cls(d["which"], value)
+        solution._text = text
+        return solution
+
+    def __str__(self):
+        if self._text is None:
+            if (self.exact is None) and (self.known is not None) and (self.value is not None):
+                self.exact = triangle_exact(self.which, self.known, self.value)
+            if self.value is None:
+                self._text = "This triangle is unsolvable!"
+            elif isinstance(self.value, Interval):
+                lo, hi = self.exact or (None, None)
+                self._text = "(%s, %s)" % (format_exact(lo, float(self.value.a)), format_exact(hi, float(self.value.b)))
+            else:
+                self._text = format_exact(self.exact, self.value)
+        return self._text
+
+    def to_dict(self):
+        if isinstance(self.value, Interval):
+            value = {"min": self.value.a, "max": self.value.b}
+        else:
+            value = self.value
+        return {"type": "triangle", "which": self.which, "value": value}
+
+
+class ResultCache():
+    """持久化的结果缓存（SQLite），多个进程、多次运行可共用同一个文件
+
+    键为规范化后的题目（见problem_key），值为结果的to_dict及其字符串表示（JSON）。
+    条目数超过max_entries时淘汰最久未访问的（每插入evict_every条检查一次），version与文件中记录的不同时清空整个缓存。
+    同一进程中的各个线程共用一个连接，访问时加锁。
+    """
+
+    # 求解或输出的结果有变化时需增加
+    version = 4
+    # 访问时间攒够这么多条再写回，使命中时不必每次都写文件
+    flush_every = 256
+    # 每插入这么多条检查一次条目数
+    evict_every = 64
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.conn = None
+        self.pid = None
+        self.touched = {}
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = RLock()
+
+    def connect(self):
+        """返回数据库连接，fork出的子进程会重新连接"""
+        import sqlite3
+        if self.pid == os.getpid():
+            return self.conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, atime INTEGER)")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_atime ON results (atime)")
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if (row is None) or (row[0] != str(self.version)):
+            conn.execute("DELETE FROM results")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(self.version),))
+        conn.execute("COMMIT")
+        if self.pid is None:
+            import atexit
+            atexit.register(self.close)
+        self.conn, self.pid, self.touched = conn, os.getpid(), {}
+        return conn
+
+    def get(self, key):
+        """返回key对应的(字典, 字符串)，没有时返回None"""
+        import json
+        with self.lock:
+            row = self.connect().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched[key] = time_ns()
+            if len(self.touched) >= self.flush_every:
+                self.flush()
+        payload = json.loads(row[0])
+        return payload["result"], payload["text"]
+
+    def put(self, key, result, text):
+        import json
+        value = json.dumps({"result": result, "text": text})
+        with self.lock:
+            self.connect().execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, value, time_ns()))
+            self.touched.pop(key, None)
+            self.puts += 1
+            if self.puts % self.evict_every == 0:
+                self.evict()
+
+    def flush(self):
+        """写回命中的条目的访问时间"""
+        with self.lock:
+            if self.touched and (self.pid == os.getpid()):
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany("UPDATE results SET atime = ? WHERE key = ?",
+                                          [(t, k) for k, t in self.touched.items()])
+                self.touched = {}
+
+    def evict(self):
+        """条目数超过max_entries时，淘汰最久未访问的条目直至只剩max_entries的九成"""
+        with self.lock:
+            self.flush()
+            conn = self.connect()
+            count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY atime LIMIT ?)",
+                             (count - self.max_entries * 9 // 10,))
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.connect().execute("DELETE FROM results")
+            self.touched = {}
+
+    def close(self):
+        with self.lock:
+            if (self.conn is not None) and (self.pid == os.getpid()):
+                self.flush()
+                self.conn.close()
+            self.conn, self.pid = None, None
+
+
+def problem_key(kind, *parts):
+    """将题目规范化为缓存的键，数都用float.hex表示
+
+    影响结果的设置（单位圆的弧度圈、是否使用高精度、set eps的两个容差、识别数的范围）也是键的一部分
+    """
+    items = [kind]
+    for part in parts:
+        if part is None:
+            items.append("-")
+        elif isinstance(part, str):
+            items.append(part)
+        elif isinstance(part, (list, tuple)):
+            items.append(",".join(float(x).hex() for x in part))
+        else:
+            items.append(float(part).hex())
+    items.append("grid=%s" % ",".join(map(str, unit_circle_grid)))
+    items.append("high" if high_precision else "adaptive%d" % precision_dps if adaptive_precision else "float")
+    items.append("eps=%s,%s" % (float(ambiguous_eps).hex(), float(recognize_eps).hex()))
+    items.append("identify=%d,%d" % (identify_max_den, identify_max_period))
+    return "|".join(items)
+
+
+# 持久化的结果缓存，通过set_cache、set cache命令、--cache选项或环境变量TRIG_CACHE开启
+result_cache = ResultCache(os.environ["TRIG_CACHE"]) if os.environ.get("TRIG_CACHE") else None
+
+
+def set_cache(path, max_entries=100000):
+    """开启（path为文件路径）或关闭（path为None）持久化的结果缓存"""
+    global result_cache
+    if result_cache is not None:
+        result_cache.close()
+    result_cache = None if path is None else ResultCache(path, max_entries)
+
+
+def cached_result(key, cls):
+    """从结果缓存中取出key对应的结果，没有时返回None"""
+    if (result_cache is None) or (key is None):
+        return None
+    with profiler.stage("cache"):
+        found = result_cache.get(key)
+    if found is None:
+        return None
+    return cls.from_dict(*found)
+
+
+# 定义域内的解（或区间）超过这么多个时不缓存
+cache_max_solutions = 65536
+
+
+def store_result(solution):
+    """将求出的结果（连同字符串表示）存入结果缓存，已在缓存中的跳过"""
+    if (result_cache is None) or (solution is None) or (solution.cache_key is None):
+        return
+    if isinstance(solution, EquationSolution) and (solution.domain is not None):
+        s, e = solution.domain
+        if len(solution.families) * ((e - s) / solution.families[0].period + 1) > cache_max_solutions:
+            return
+    if isinstance(solution, InequalitySolution) and (solution.domain is not None):
+        s, e = solution.domain
+        if (e - s) / solution.interval.period + 1 > cache_max_solutions:
+            return
+    with profiler.stage("cache"):
+        result_cache.put(solution.cache_key, solution.to_dict(), str(solution))
+    solution.cache_key = None
+
+
+class NotSimplestError(TrigError):
+    """左边是合法的表达式，但不是最简三角函数"""
+
+
+def parse_left(expr, kind="equation"):
+    """解析并检查方程（不等式）的左边，返回(函数名, x的系数)"""
+    try:
+        left = trig_eval(expr, "trig")
+    except ValueError:
+        raise TrigError("Error: Invalid left expr!") from None
+    except:
+        # 语法正确，只是不能化为最简的形式（如sin(x)+cos(x)）
+        left = None
+    try:
+        simplest = is_simplest(left)
+    except:
+        simplest = False
+    if not simplest:
+        raise NotSimplestError("ERROR: Only support simplest trigonometric %s!" % ("equation" if kind == "equation" else "inequation"))
+    return left.name, get_coeff_and_addend(left)
+
+
+@lru_cache(maxsize=1024)
+def parse_wave(expr):
+    """解析求值域的式子，返回(a, b, c, omega)，即a*sin(omega*x) + b*cos(omega*x) + c（omega为0时是常数b + c）"""
+    try:
+        compiled = compile_expr(expr, "wave")
+    except ValueError:
+        raise TrigError("Error: Invalid expr!") from None
+    try:
+        with profiler.stage("parse"):
+            wave = compiled()
+    except TypeError:
+        # 语法正确，只是不能化为一个正弦型函数（如sin(x)*cos(x)、sin(x)+cos(2*x)）
+        wave = None
+    except (ValueError, ZeroDivisionError, OverflowError):
+        raise TrigError("Error: Invalid expr!") from None
+    if isinstance(wave, Number):
+        return 0.0, 0.0, float(wave), 0.0
+    if (wave is None) or wave.k:
+        raise TrigError("ERROR: Only support a*sin(wx)+b*cos(wx)+c!")
+    return wave.a, wave.b, wave.c, wave.omega
+
+
+def right_value(val):
+    """方程（不等式）右边的值，转换为有限的浮点数，不能求值（如1/0、10**400、(-1)**0.5）或不是有限的数时抛出TrigError"""
+    try:
+        value = float(trig_eval(val) if isinstance(val, str) else val)
+    except (ValueError, ArithmeticError, TypeError):
+        raise TrigError("Error: Invalid right value!") from None
+    if not math.isfinite(value):
+        raise TrigError("Error: Invalid right value!")
+    return value
+
+
+inverse_funcs = {"sin": math.asin, "cos": math.acos, "tan": math.atan}
+
+
+def find_special(name, val, source=None, exact=None):
+    """寻找特殊解，没有时返回None
+
+    @param source 求得val的表达式，见precise_eq
+    @param exact  val的精确值，给出时直接查表
+    """
+    if exact is not None:
+        return special[name].get(exact.p) if exact.is_rational and (exact.d == 1) else None
+    with profiler.stage("special"):
+        for k, v in special[name].items():
+            if precise_eq(val, k, source):
+                return v
+    return None
+
+
+def solve_equation(expr, val, domain=None):
+    """求解三角方程，返回EquationSolution
+
+    @param expr   等号左边的表达式
+    @param val    值（表达式或数）
+    @param domain 定义域（闭区间[s, e]），给出时求出定义域内的解；
+                  不是最简方程时用数值方法在定义域内求解（见solve_numeric）
+    """
+    try:
+        name, coeff = parse_left(expr)
+    except NotSimplestError:
+        if domain is None:
+            raise
+        return solve_numeric(expr, val, domain)
+    source = val if isinstance(val, str) else None
+    # 值的精确值，知道时特殊解、主值解及字符串表示都不必再识别
+    exact = exact_value(source) if source is not None else ExactValue.coerce(val)
+    val = right_value(val)
+    try:
+        if exact is not None:
+            val = exact.value
+        elif (name != "tan") and (abs(val) > 1) and precise_eq(abs(val), 1, source if val > 0 else "-(%s)" % source):
+            # 如0.1*3/0.3，舍入误差使其略大于1
+            val = math.copysign(1.0, val)
+        sol = inverse_funcs[name](val)
+    except ValueError:
+        raise TrigError("Error: Invalid right value!") from None
+    key = None
+    if result_cache is not None:
+        key = problem_key("equation", name, coeff, val, domain)
+        if (solution := cached_result(key, EquationSolution)) is not None:
+            return solution
+    solution = EquationSolution(name, coeff, val, sol, find_special(name, val, source, exact), domain,
+                                exact, exact_coeff(expr, coeff))
+    solution.source = source
+    solution.cache_key = key
+    return solution
+
+
+# EquationBatch.form中各序号所对应的表示方法，见EquationSolution.form
+equation_forms = ("special", "pi", "inverse")
+np_inverse_funcs = {"sin": "arcsin", "cos": "arccos", "tan": "arctan"}
+
+
+def match_pi_fractions(np, x, max_den):
+    """同时识别一组数中的pπ/d（d不超过max_den），返回(p, d)两列，不能识别的d为0
+
+    即对每个数x/π同时做连分数展开（见identify_num），只继续展开尚未识别的数
+    """
+    y = x / math.pi
+    eps = ambiguous_eps * np.maximum(1.0, np.abs(x)) / math.pi
+    p, d = np.zeros(len(x), dtype=np.int64), np.zeros(len(x), dtype=np.int64)
+    h0, h1 = np.zeros_like(y), np.ones_like(y)
+    k0, k1 = np.ones_like(y), np.zeros_like(y)
+    active = np.isfinite(y)
+    z = np.where(active, y, 0.0)
+    for _ in range(64):
+        a = np.floor(z)
+        h0, h1 = h1, a * h1 + h0
+        k0, k1 = k1, a * k1 + k0
+        active &= k1 <= max_den
+        hit = active & (np.abs(y - h1 / np.where(active, k1, 1.0)) <= eps)
+        p[hit], d[hit] = h1[hit], k1[hit]
+        f = z - a
+        active &= ~hit & (f >= 2.0 ** -60)
+        if not active.any():
             break
-        if gcd(value, i) == i:
-            result.append(i)
-            value = value // i
-            i = 2
-            continue
-        i += 1
-    inner, outter = [], 1
-    for i in result:
-        if inner.count(i) == 1:
-            inner.remove(i)
-            outter *= i
+        z = np.divide(1.0, f, out=np.zeros_like(f), where=active)
+    # 与precise_eq（不知道求得该数的表达式时）相同的判断
+    found = d > 0
+    exact = np.where(found, p * math.pi / np.maximum(d, 1), 0.0)
+    d[found & (np.abs(x - exact) > 2.0 ** -49 * np.maximum(1.0, np.maximum(np.abs(x), np.abs(exact))))] = 0
+    return p, d
+
+
+def equ_many(lhs, values, domain=None):
+    """求解左边相同、右边为values中各数的一批最简三角方程，返回EquationBatch（需要numpy）
+
+    左边只解析一次，反三角函数、特殊值及弧度的识别都对整列同时进行
+
+    @param lhs    等号左边的表达式
+    @param values 右边的各个数（数组）
+    @param domain 定义域（闭区间[s, e]），给出时EquationBatch.solutions为定义域内的解
+    """
+    np = load_numpy()
+    with profiler.stage("parse"):
+        name, coeff = parse_left(lhs)
+    values = np.array(values, dtype=np.float64).ravel()
+    with profiler.stage("special"):
+        if name != "tan":
+            # 如0.1*3/0.3，舍入误差使其略大于1
+            near = (np.abs(values) > 1) & np.isfinite(values) & (np.abs(values) - 1 <= 2.0 ** -49 * np.abs(values))
+            values[near] = np.copysign(1.0, values[near])
+            valid = np.abs(values) <= 1
+        else:
+            valid = np.isfinite(values)
+        sols = getattr(np, np_inverse_funcs[name])(np.where(valid, values, 0.0))
+        sols[~valid] = np.nan
+        form = np.full(len(values), equation_forms.index("inverse"), dtype=np.int8)
+        for k in special[name]:
+            form[np.abs(values - k) <= 2.0 ** -49 * np.maximum(1.0, np.abs(values))] = equation_forms.index("special")
+        p, d = match_pi_fractions(np, sols, identify_max_den)
+        form[(d > 0) & (form != equation_forms.index("special"))] = equation_forms.index("pi")
+        form[~valid] = -1
+        # 相同的精确值只保存一次
+        pairs, exact = np.unique(np.stack([p, d], axis=1)[d > 0], axis=0, return_inverse=True)
+        exact_ids = np.full(len(values), -1, dtype=np.int64)
+        exact_ids[d > 0] = exact.ravel()
+        exact_forms = [ExactValue(int(a), int(b), pi=True) for a, b in pairs.tolist()]
+    if name == "sin":
+        offsets, period = np.stack([sols, math.pi - sols], axis=1), 2 * math.pi
+    elif name == "cos":
+        offsets, period = np.stack([sols, -sols], axis=1), 2 * math.pi
+    else:
+        offsets, period = sols[:, None], math.pi
+    period = np.full(len(values), abs(period / coeff))
+    return EquationBatch(name, coeff, values, sols, offsets / coeff, period, form, exact_ids, exact_forms,
+                         None if domain is None else [float(domain[0]), float(domain[1])])
+
+
+# 数值求解时每个周期内的采样点数、每次求值的点数及迭代次数
+numeric_samples = 32
+numeric_chunk = 1 << 18
+numeric_iterations = 100
+
+
+def numeric_namespace(np, x):
+    return {"sin": np.sin, "cos": np.cos, "tan": np.tan, "sqrt": np.sqrt, "pi": math.pi, "x": x,
+            "_pow": guarded_pow, "__builtins__": {}}
+
+
+def trig_rates(np, source, s, e):
+    """估计表达式中各三角函数的参数在[s, e]上变化的最大速度（即最高的角频率）"""
+    xs = np.linspace(s, e, 4097)
+    rate = 0.0
+    for node in ast.walk(ast.parse(source.strip(), mode="eval")):
+        if isinstance(node, ast.Call) and (node.func.id in ["sin", "cos", "tan"]) and node.args:
+            code = compile(ast.Expression(node.args[0]), "<trig>", "eval")
+            arg = np.asarray(eval(code, numeric_namespace(np, xs)), dtype=float) + np.zeros_like(xs)
+            rate = max(rate, float(np.nanmax(np.abs(np.diff(arg)), initial=0.0)) / (xs[1] - xs[0]))
+    return rate
+
+
+def refine_roots(np, f, a, b, fa, fb):
+    """用Illinois法（改进的试位法）同时细化所有的有根区间[a, b]，要求fa与fb异号
+
+    每次迭代只对尚未收敛（步长仍大于舍入误差）的区间求值
+    """
+    b, fb = b.copy(), fb.copy()
+    active = np.arange(len(a))
+    a, fa = a.copy(), fa.copy()
+    for i in range(numeric_iterations):
+        if not len(active):
+            break
+        a_, b_, fa_, fb_ = a[active], b[active], fa[active], fb[active]
+        c = (a_ * fb_ - b_ * fa_) / (fb_ - fa_)
+        # 分母为0（两端值相同）时取中点
+        c = np.where(np.isfinite(c), c, (a_ + b_) / 2)
+        fc = f(c)
+        flip = np.sign(fc) != np.sign(fb_)
+        a[active], fa[active] = np.where(flip, b_, a_), np.where(flip, fb_, fa_ / 2)
+        b[active], fb[active] = c, fc
+        done = (np.abs(c - b_) <= 4e-16 * np.maximum(1, np.abs(c))) | (fc == 0)
+        active = active[~done]
+    return b, fb
+
+
+def solve_numeric(expr, val, domain):
+    """在定义域内用数值方法求解任意的方程expr = val，返回NumericSolution
+
+    先按表达式中的最高频率在网格上采样，找出变号的区间及（与x轴相切的）极值点，
+    再同时细化所有的根（切点为导数的根），去掉重复的根后从小到大排列
+    """
+    np = load_numpy()
+    val = right_value(val)
+    compiled = compile_expr(expr.strip(), "trig")
+    s, e = domain
+
+    def f(x):
+        return np.asarray(compiled(numeric_namespace(np, x)), dtype=float) - val + np.zeros_like(x)
+
+    def df(x):
+        # 复步长求导，没有相减造成的舍入误差
+        return np.imag(compiled(numeric_namespace(np, x + 1e-20j))) / 1e-20 + np.zeros_like(x)
+
+    roots = []
+    with profiler.stage("numeric"), np.errstate(all="ignore"):
+        rate = trig_rates(np, expr, s, e)
+        n = max(1024, ceil((e - s) * rate / (2 * math.pi) * numeric_samples))
+        h = (e - s) / n
+        # 求值的舍入误差随值及三角函数参数的大小而定，切点处的函数值需在其范围内
+        tol = 64 * 2.0 ** -52 * (1 + abs(val) + rate * max(abs(s), abs(e)))
+        for start in range(0, n, numeric_chunk):
+            xs = s + h * np.arange(start, min(n, start + numeric_chunk) + 1)
+            xs[-1] = min(xs[-1], e)
+            fs = f(xs)
+            roots.append(xs[fs == 0])
+            # 端点处的根不一定变号
+            roots.append(np.array([x for x in [s, e] if abs(f(np.array([x]))[0]) <= tol]))
+            # 变号的区间
+            i = np.nonzero(np.sign(fs[:-1]) * np.sign(fs[1:]) < 0)[0]
+            x, fx = refine_roots(np, f, xs[i], xs[i + 1], fs[i], fs[i + 1])
+            # tan的间断点处同样变号，但越接近间断点函数值越大
+            roots.append(x[(np.abs(fx) <= tol) | (np.abs(fx) < 1e-3 * np.minimum(np.abs(fs[i]), np.abs(fs[i + 1])))])
+            # 不变号的极值点可能是切点，求出导数的零点后检查函数值
+            d = np.diff(fs)
+            i = np.nonzero(np.sign(d[:-1]) * np.sign(d[1:]) < 0)[0] + 1
+            i = i[np.abs(fs[i]) <= np.abs(d[i - 1]) + np.abs(d[i])]
+            if len(i):
+                a, b = xs[i - 1], xs[i + 1]
+                x, _ = refine_roots(np, df, a, b, df(a), df(b))
+                roots.append(x[np.abs(f(x)) <= tol])
+        roots = np.sort(np.concatenate(roots))
+        roots = roots[(roots >= s) & (roots <= e)]
+        # 去掉重复的根
+        if len(roots):
+            keep = np.concatenate([[True], np.diff(roots) > 1e-9 * np.maximum(1, np.abs(roots[1:]))])
+            roots = roots[keep]
+    profiler.count("numeric.roots", len(roots))
+    return NumericSolution(expr, val, domain, roots.tolist())
+
+
+def solve_inequality(expr, val, op, domain=None):
+    """求解三角不等式，返回InequalitySolution
+
+    @param expr   一个式子
+    @param val    值（表达式或数）
+    @param op     不等号
+    @param domain 定义域（闭区间[s, e]），给出时求出定义域内的解集
+    """
+    name, coeff = parse_left(expr, "inequality")
+    source = val if isinstance(val, str) else None
+    exact = exact_value(source) if source is not None else ExactValue.coerce(val)
+    value = right_value(val)
+    if exact is not None:
+        value = exact.value
+    key = None
+    if result_cache is not None:
+        key = problem_key("inequality", name, coeff, value, op, domain)
+        if (solution := cached_result(key, InequalitySolution)) is not None:
+            return solution
+    closed = "=" in op
+    # sin和cos借助单位圆：get_trig逆时针（从-π/2开始）找出的两个弧度x1 < x2（均为精确值）
+    if name in ["sin", "cos"]:
+        try:
+            (x1, _), (x2, _) = get_trig(name[0], value, source, exact)
+        except ValueError:
+            raise TrigError("Error: Could not find solution!") from None
+        two_pi = ExactValue(2, pi=True)
+        if name == "sin":
+            if ">" in op:
+                lo, hi = x1, x2
+            elif value >= 0:
+                # 此时解集穿过x轴正半轴，需表示成(2kπ-α, 2kπ+β)
+                lo, hi = x2 - two_pi, x1
+            else:
+                lo, hi = x2, x1 + two_pi
+        else:
+            if (">" in op) and (value >= 0):
+                lo, hi = x1, x2
+            elif ">" in op:
+                # 此时解集穿过x轴正半轴
+                lo, hi = x2 - two_pi, x1
+            elif value < 0:
+                lo, hi = x1, x2
+            else:
+                # 此时解集为第一象限始边到第四象限终边
+                lo, hi = x2, x1 + two_pi
+        interval = PeriodicInterval(lo.value, hi.value, 2 * math.pi, closed, closed, lo, hi)
+    elif name == "tan":
+        # tan最简单，看函数图像即可出结果
+        sol = math.atan(value)
+        exact_sol = None if exact is None else exact_inverse(name, exact)
+        half_pi = ExactValue(1, 2, pi=True)
+        if ">" in op:
+            interval = PeriodicInterval(sol, math.pi / 2, math.pi, closed, False, exact_sol, half_pi)
         else:
-            inner.append(i)
-    return "%ssqrt(%d)" % ("" if outter == 1 else outter, fp.fprod(inner))
+            interval = PeriodicInterval(-math.pi / 2, sol, math.pi, False, closed, -half_pi, exact_sol)
+    solution = InequalitySolution(name, coeff, value, op, interval.scale(coeff, exact_coeff(expr, coeff)), domain)
+    solution.cache_key = key
+    return solution
+
 
+def solve_range(expr, domain=None):
+    """求a*sin(omega*x) + b*cos(omega*x) + c的值域，返回RangeSolution
 
-def get_num_string(value, always_p=False):
-    """返回一些有理数/无理数的分式表示：
+    @param expr   一个式子（如"sin(2*x)+sqrt(3)*cos(2*x)"），各项的频率须相同
+    @param domain 定义域（闭区间[s, e]），给出时求出定义域内的值域
+    """
+    coeff = parse_wave(expr)
+    key = None
+    if result_cache is not None:
+        key = problem_key("range", *coeff, domain)
+        if (solution := cached_result(key, RangeSolution)) is not None:
+            return solution
+    with profiler.stage("range"):
+        value = wave_range(*coeff) if domain is None else wave_range(*coeff, float(domain[0]), float(domain[1]))
+    solution = RangeSolution(expr, coeff, domain, value)
+    solution.cache_key = key
+    return solution
 
-    1. 弧度
-    2. 分子、分母都为整数的分数
-    3. sqrt(a)/b型的数
 
-    @param value      某浮点数
-    @param always_p   返回的弧度是否为正（在弧度值本身为正的情况下），若为True则返回5π/3而非-π/3
+def triangle_target_key(which):
+    """所求的规范形式：三边的线性组合用各边的系数表示，如"2*a + c"和"c+2*a"相同"""
+    if which == "area":
+        return which
+    try:
+        result = trig_eval(which, "side")
+    except:
+        return which
+    if isinstance(result, Combination):
+        return repr(result)
+    return which
+
+
+def solve_triangle(which, **known):
+    """解三角形，返回TriangleSolution
+
+    @param which 所求（"area"或三边的线性组合）
+    @param known 已知量（a、b、c、A、B、C、area、cric），值为表达式或数
     """
-    global has_try_arcus
-    if fp.almosteq(value, 0):
-        return "0"
-    frac = Fraction(value / fp.pi).limit_denominator(10000)
-    a, b = frac.as_integer_ratio()
-    if fp.almosteq(value, frac * fp.pi):
-        if b == 1:
-            return "%s%s" % (a if abs(a) != 1 else str(a).replace("1", ""), pi_s)
-        if always_p:
-            return "%s%s/%s" % (a if abs(a) != 1 else str(a).replace("1", ""), pi_s, b)
-        else:
-            if fp.almosteq((a + 1) / b, 2):
-                return "-%s/%s" % (pi_s, b)
-            else:
-                return "%s%s/%s" % (a if abs(a) != 1 else str(a).replace("1", ""), pi_s, b)
-    else:
-        a, b = Fraction(value).limit_denominator(10000).as_integer_ratio()
-        if fp.almosteq(value, a / b):
-            return "%s%s%s" % (a, "/" if b != 1 else "", "" if b == 1 else b)
-        else:
-            flag = "" if value > 0 else "-"
-            a, b = Fraction(
-                value ** 2).limit_denominator(10000).as_integer_ratio()
-            # 由于计算机算术的误差，不得不设置一个1e-10的误差
-            if fp.almosteq(value ** 2, a / b, 1e-10):
-                if (a == 1) and (b != 1):
-                    return "%ssqrt(%s)/%s" % (flag, b, b)
-                else:
-                    return "%s%s%s%s" % (flag, simplify_sqrt(a), "/" if b != 1 else "", "" if b == 1 else int(fp.sqrt(b)))
-            else:
-                return str(value)
+    kwargs = {}
+    for k, v in known.items():
+        mode = "ang" if k in ["A", "B", "C"] else "num"
+        try:
+            if k in ["a", "b", "c", "area", "cric", "A", "B", "C"]:
+                kwargs[k] = float(trig_eval(v, mode) if isinstance(v, str) else v)
+        except:
+            raise TrigError("Error: Bad argument: \"%s=%s\"!" % (k, v)) from None
+    key = None
+    if result_cache is not None:
+        key = problem_key("triangle", triangle_target_key(which),
+                          *["%s=%s" % (k, float(v).hex()) for k, v in sorted(kwargs.items())])
+        if (solution := cached_result(key, TriangleSolution)) is not None:
+            return solution
+    value = Triangle(**kwargs).solve(which)
+    solution = TriangleSolution(which, value, known=tuple((k, known[k], kwargs[k]) for k in sorted(kwargs)))
+    solution.cache_key = key
+    return solution
+
+
+# 批量解三角形时的输入列（角用弧度表示，未知为nan）及输出列（带2的为边边角时的第二个解）
+triangle_columns = ["a", "b", "c", "A", "B", "C"]
+triangle_out_columns = triangle_columns + ["area"] + [k + "2" for k in triangle_columns + ["area"]] + ["solutions"]
+
+
+def fill_angles(np, t):
+    """已知两角时求第三个角"""
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        m = np.isnan(t[i]) & ~np.isnan(t[j]) & ~np.isnan(t[k])
+        t[i][m] = (math.pi - t[j] - t[k])[m]
 
 
-def get_trig(name, value):
-    """返回一个三角比的值对应的弧度（一般情况下是两个）
+def fill_by_sines(np, s, t):
+    """已知三角及一边时用正弦定理求其余的边，已知三边时用余弦定理求各角"""
+    fill_angles(np, t)
+    double_R = np.full(len(s[0]), np.nan)
+    for i in range(3):
+        double_R = np.where(np.isnan(double_R), s[i] / np.sin(t[i]), double_R)
+    for i in range(3):
+        m = np.isnan(s[i])
+        s[i][m] = (double_R * np.sin(t[i]))[m]
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        m = np.isnan(t[i]) & ~np.isnan(s[0]) & ~np.isnan(s[1]) & ~np.isnan(s[2])
+        t[i][m] = np.arccos(np.clip((s[j] ** 2 + s[k] ** 2 - s[i] ** 2) / (2 * s[j] * s[k]), -1, 1))[m]
+    fill_angles(np, t)
 
-    @param name  三角比的名称（"s", "c", "t"）
-    @param value 三角比的值
+
+def valid_triangles(np, s, t):
+    """各边、各角有限且为正、各角和为π、满足三边关系的行"""
+    valid = np.ones(len(s[0]), dtype=bool)
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        valid &= np.isfinite(s[i]) & np.isfinite(t[i]) & (s[i] > 0) & (t[i] > 0) & (s[j] + s[k] > s[i])
+    return valid & (np.abs(t[0] + t[1] + t[2] - math.pi) <= 1e-9)
+
+
+def solve_triangles(columns):
+    """向量化地解多个三角形，返回以triangle_out_columns为键的列
+
+    @param columns 以a、b、c、A、B、C为键的列（未给出或为nan表示未知），
+                   可为边边边、边角边、角边角、角角边、边边角（可能有两个解）
     """
-    if name[0] == "s":
-        f = fp.sin
-    if name[0] == "c":
-        f = fp.cos
-    if name[0] == "t":
-        f = fp.tan
-    result = []
-    for i in unit_circle:
-        if fp.almosteq(value, f(i)):
-            result.append([get_num_string(i), i])
+    np = load_numpy()
+    n = len(next(iter(columns.values())))
+    s = [np.array(columns[k], dtype=float) if k in columns else np.full(n, np.nan) for k in "abc"]
+    t = [np.array(columns[k], dtype=float) if k in columns else np.full(n, np.nan) for k in "ABC"]
+    with profiler.stage("triangles"), np.errstate(all="ignore"):
+        fill_angles(np, t)
+        # 边角边：用余弦定理求第三边
+        for i in range(3):
+            j, k = (i + 1) % 3, (i + 2) % 3
+            m = np.isnan(s[i]) & ~np.isnan(s[j]) & ~np.isnan(s[k]) & ~np.isnan(t[i])
+            s[i][m] = np.sqrt(s[j] ** 2 + s[k] ** 2 - 2 * s[j] * s[k] * np.cos(t[i]))[m]
+        # 边边角：已知s[i]、t[i]及s[j]，由正弦定理得sin(t[j])，t[j]可能有锐角、钝角两个解
+        s2, t2 = [x.copy() for x in s], [x.copy() for x in t]
+        ambiguous = np.zeros(n, dtype=bool)
+        for i in range(3):
+            for j in range(3):
+                k = 3 - i - j
+                if i == j:
+                    continue
+                m = ~np.isnan(s[i]) & ~np.isnan(t[i]) & ~np.isnan(s[j]) & np.isnan(t[j]) & np.isnan(s[k])
+                sine = s[j] * np.sin(t[i]) / s[i]
+                acute = np.arcsin(sine)
+                second = m & (sine < 1 - 1e-12) & (t[i] + math.pi - acute < math.pi - 1e-12)
+                t[j][m] = acute[m]
+                t2[j][m] = (math.pi - acute)[m]
+                ambiguous |= second
+        fill_by_sines(np, s, t)
+        fill_by_sines(np, s2, t2)
+        valid = valid_triangles(np, s, t)
+        valid2 = ambiguous & valid_triangles(np, s2, t2)
+        result = {}
+        for suffix, sides, angles, ok in [("", s, t, valid), ("2", s2, t2, valid2)]:
+            a, b, c = sides
+            # 同heron_formular，使用海伦公式求面积
+            p = (a + b + c) / 2
+            area = np.sqrt(p * (p - a) * (p - b) * (p - c))
+            for name, column in zip(triangle_columns + ["area"], sides + angles + [area]):
+                result[name + suffix] = np.where(ok, column, np.nan)
+        result["solutions"] = valid.astype(np.int8) + valid2
+    profiler.count("triangles.rows", n)
     return result
 
 
-def trig_eval(s, cond="num"):
-    """解析输入的表达式
+def iter_triangle_chunks(path, chunk=65536):
+    """分块读入三角形，每次给出以triangle_columns中的名称为键的列
 
-    @param s    某表达式
-    @param cond 何种类型
+    @param path  CSV文件（首行为列名，空白表示未知，无法解析的数见cell_value，"-"为标准输入）或.npy文件（结构化数组，或按a、b、c、A、B、C排列的二维数组）
+    @param chunk 每块的行数
     """
-    if cond == "trig":
-        if s == "s":
-            return func_sin(Variable())
-        elif s == "c":
-            return func_cos(Variable())
-        elif s == "t":
-            return func_tan(Variable())
-        return eval(s, {"cos": lambda x: func_cos(x), "sin": lambda x: func_sin(x),
-                        "sqrt": fp.sqrt, "pi": fp.pi, "tan": lambda x: func_tan(x),
-                        "x": Variable(), "__builtins__": {}})
-    elif cond == "num":
-        return eval(s, {"sqrt": fp.sqrt, "pi": fp.pi, "__builtins__": {}})
-    elif cond == "ang":
-        return eval(s, {"asin": lambda x: fp.asin(x), "acos": lambda x: fp.acos(x),
-                        "atan": lambda x: fp.atan(x), "pi": fp.pi, "__builtins__": {}})
+    np = load_numpy()
+    if path.endswith(".npy"):
+        data = np.load(path, mmap_mode="r")
+        names = data.dtype.names or triangle_columns[:data.shape[1]]
+        for start in range(0, len(data), chunk):
+            block = data[start:start + chunk]
+            if data.dtype.names:
+                yield {k: np.asarray(block[k], dtype=float) for k in names if k in triangle_columns}
+            else:
+                yield {k: np.asarray(block[:, i], dtype=float) for i, k in enumerate(names)}
+        return
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        names, rows = triangle_csv(stream)
+        nan = math.nan
+        while block := list(islice(rows, chunk)):
+            cells = chain.from_iterable(block)
+            try:
+                values = [float(cell) if cell else nan for cell in cells]
+            except ValueError:
+                values = [cell_value(cell) for cell in chain.from_iterable(block)]
+                profiler.count("triangles.bad_cells", sum(math.isinf(v) for v in values))
+            block = np.array(values, dtype=float).reshape(len(block), len(names))
+            yield {k: block[:, i] for i, k in enumerate(names)}
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
 
-def get_coeff_and_addend(left):
-    if isinstance(left.args[0], Variable):
-        return 1
-    return left.args[0].coeff[Variable()]
+def triangle_csv(stream):
+    """读入CSV的首行，返回(列名, 逐行给出各个格子的迭代器)，跳过空行，列数不对时抛出TrigError"""
+    import csv
+    reader = csv.reader(stream)
+    names = [name.strip() for name in next(reader, [])]
+    if not names:
+        raise TrigError("Error: The file is empty!")
+    for name in names:
+        if name not in triangle_columns:
+            raise TrigError("Error: Unknown column \"%s\"!" % name)
 
+    def rows():
+        for row in reader:
+            if len(row) != len(names):
+                if not "".join(row).strip():
+                    continue
+                raise TrigError("Error: Line %d has %d values, expected %d!" % (reader.line_num, len(row), len(names)))
+            yield row
 
-def build_sol(expr, left):
-    """根据左值和最简方程的解构建最终解
+    return names, rows()
 
-    @param expr 包含解和一些控制标志的字典
-    @param left 左值
+
+def cell_value(cell):
+    """CSV中一个格子的数，空白表示未知（nan）
+
+    无法解析的数视为inf，与其他超出范围的数一样使这一行无解，而不是中止整个文件
     """
-    x_coeff = get_coeff_and_addend(left)
-    result = []
-    for item, action in expr.items():
-        if action == False:
-            result.append(item)
+    cell = cell.strip()
+    if not cell:
+        return math.nan
+    try:
+        return float(cell)
+    except ValueError:
+        return math.inf
+
+
+def count_rows(path):
+    """数出CSV文件中数据的行数，与iter_triangle_chunks给出的行数相同"""
+    with open(path, encoding="utf-8", newline="") as f:
+        return sum(1 for _ in triangle_csv(f)[1])
+
+
+def solve_triangle_file(path, out="-", chunk=65536):
+    """分块读入、解三角形并写出，内存占用只与chunk有关，返回行数
+
+    @param path  输入文件，见iter_triangle_chunks
+    @param out   输出文件：.npy（结构化数组，各列见triangle_out_columns）或CSV（"-"为标准输出）
+    @param chunk 每块的行数
+    """
+    np = load_numpy()
+    rows = 0
+    if out.endswith(".npy"):
+        if path.endswith(".npy"):
+            total = len(np.load(path, mmap_mode="r"))
+        elif path == "-":
+            raise TrigError("Error: Can't write .npy when reading from stdin!")
         else:
-            if isinstance(item, Number):
-                result.append(get_num_string(item / x_coeff))
-            else:
-                if "*" in item:
-                    coeff, item = item.split("*")
-                else:
-                    coeff = 1
-                a, b = Fraction(
-                    float(coeff) / x_coeff).limit_denominator(1000).as_integer_ratio()
-                result.append("%s%s%s%s" % (a if abs(a) != 1 else str(a).replace("1", ""), item,
-                                            "/" if b != 1 else "", "" if b == 1 else b))
-    return " ".join(result)
+            total = count_rows(path)
+        dtype = [(k, np.int8 if k == "solutions" else float) for k in triangle_out_columns]
+        output = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=(total,))
+        for columns in iter_triangle_chunks(path, chunk):
+            result = solve_triangles(columns)
+            for k in triangle_out_columns:
+                output[k][rows:rows + len(result[k])] = result[k]
+            rows += len(result["a"])
+        output.flush()
+        return rows
+    stream = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+    try:
+        for columns in iter_triangle_chunks(path, chunk):
+            result = solve_triangles(columns)
+            if rows == 0:
+                stream.write(",".join(triangle_out_columns) + "\n")
+            block = np.column_stack([result[k] for k in triangle_out_columns])
+            np.savetxt(stream, block, delimiter=",", fmt=["%.17g"] * (len(triangle_out_columns) - 1) + ["%d"])
+            rows += len(block)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return rows
 
 
-def is_simplest(expr):
-    if not isinstance(expr, Function):
-        raise RuntimeError()
-    if isinstance(expr.args[0], Variable):
-        return True
-    if expr.args[0].coeff.get(Variable()) is None:
-        return False
-    if expr.args[0].coeff["addend"] == 0:
-        return True
-    return False
+class SolverContext():
+    """一次求解的上下文：定义域，以及定义域内的解写入的文件（见export_solutions）
+
+    交互模式中由set D、set out设置（即全局的D、out），只作用于一条命令；
+    在Python中可为每次求解单独创建，因此多个线程可同时调用equ、inequ
+    """
+
+    __slots__ = ("domain", "out")
+
+    def __init__(self, domain=None, out=None):
+        self.domain = domain
+        self.out = out
+
+    def __repr__(self):
+        return "SolverContext(%r, %r)" % (self.domain, self.out)
 
 
-def equ(expr, val):
-    """求解三角方程
+def equ(expr, val, context=None):
+    """求解三角方程并输出
 
-    @param expr 等号左边的表达式
-    @param val  值
+    @param expr    等号左边的表达式
+    @param val     值
+    @param context 求解的上下文（SolverContext），默认使用set命令设置的D、out，用过后重置
     """
-    global D
+    global D, out
+    repl = context is None
+    if repl:
+        context = SolverContext(D, out)
     try:
-        left = trig_eval(expr, "trig")
-        if not is_simplest(left):
-            print("ERROR: Only support simplest trigonometric equation!")
-            return
-    except:
-        print("Error: Invalid left expr!")
+        solution = solve_equation(expr, val, context.domain)
+        if (context.out is not None) and isinstance(solution, EquationSolution) and (solution.domain is not None):
+            # 定义域内的解写入文件，不再逐个输出
+            exported = export_solutions(solution, context.out)
+            print(solution.general_text())
+            print("Solution in D: %d solutions written to %s" % (len(exported), context.out))
+            if repl:
+                D = out = None
+            return solution
+        text = str(solution)
+    except TrigError as e:
+        print(e)
         return
-    if left.name == "sin":
-        f = fp.asin
-    elif left.name == "cos":
-        f = fp.acos
-    elif left.name == "tan":
-        f = fp.atan
-    try:
-        val = float(trig_eval(val))
-        sol = f(val)
-    except ValueError:
-        print("Error: Invalid right value!")
+    except OSError as e:
+        print("Error: %s" % e)
         return
-    # 寻找特殊解
-    for tn, kv in special.items():
-        if left.name == tn:
-            for k, v in kv.items():
-                if fp.almosteq(k, val):
-                    print("x = %s" % build_sol(v, left))
-                    return
-    if get_num_string(sol).find(pi_s) != -1:
-        # 可使用弧度表示的解集
-        coeff = get_coeff_and_addend(left)
-        if left.name == "sin":
-            formula = ["(k * fp.pi + (-1) ** k * %s) %s" %
-                       (sol, ("/ (%s)" % coeff) if coeff != 1 else "")]
-            print("x = " + build_sol({
-                "k%s" % pi_s: True,
-                "+" if sol > 0 else "-": False,
-                "(-1)**k": False,
-                "*": False,
-                abs(sol): True
-            }, left))
-        elif left.name == "cos":
-            formula = ["(2 * k * fp.pi + %s) %s" % (sol, ("/ (%s)" % coeff) if coeff != 1 else ""),
-                       "(2 * k * fp.pi - %s) %s" % (sol, ("/ (%s)" % coeff) if coeff != 1 else "")]
-            print("x = " + build_sol({
-                "2*k%s" % pi_s: True,
-                chr(177): False,
-                sol: True,
-            }, left))
-        elif left.name == "tan":
-            formula = ["(k * fp.pi + %s) %s" %
-                       (sol, ("/ (%s)" % coeff) if coeff != 1 else "")]
-            print("x = " + build_sol({
-                "k%s" % pi_s: True,
-                "+" if sol > 0 else "-": False,
-                abs(sol): True,
-            }, left))
-        # 如若设置了定义域，那么就在定义域内找解
-        # 请注意，算法得出正确解集的充分条件为：即参量为±1时解必在定义域内
-        if D is not None:
-            first, last, result = 0, 0, []
-            try:
-                for expr in formula:
-                    if (D[0] <= (x := eval(expr.replace("k", "(0)"))) <= D[1]):
-                        result.append(get_num_string(x))
-                        first, last = x, x
-                    i, flag = 1, 1
-                    while True:
-                        if D[0] <= (x := eval(expr.replace("k", "(%s)" % i))) <= D[1]:
-                            if get_num_string(x) not in result:
-                                if x > last:
-                                    result.append(get_num_string(x))
-                                    last = x
-                                elif x < first:
-                                    result.insert(0, get_num_string(x))
-                                    first = x
-                            i += flag * 1
-                        else:
-                            if flag == -1:
-                                break
-                            i, flag = 1, -1
-            except KeyboardInterrupt:
-                print("You stop to find solution")
-                return
-            print("Solution in D: {%s}" % ", ".join(result))
-            D = None
-    else:
-        # 如上述方法不可行，则使用反三角表示，反三角不支持寻找定义域内的解
-        if left.name == "sin":
-            print("x = " + build_sol({
-                "k%s" % pi_s: True,
-                "+" if sol > 0 else "-": False,
-                "(-1)**k": False,
-                "*": False,
-                "asin(%s)" % get_num_string(abs(val)): True
-            }, left))
-        elif left.name == "cos":
-            print("x = " + build_sol({
-                "2*k%s" % pi_s: True,
-                chr(177): False,
-                "acos(%s)" % get_num_string(val): True
-            }, left))
-        elif left.name == "tan":
-            print("x = " + build_sol({
-                "k%s" % pi_s: True,
-                "+" if sol > 0 else "-": False,
-                "atan(%s)" % get_num_string(abs(val)): True
-            }, left))
+    except KeyboardInterrupt:
+        print("You stop to find solution")
+        return
+    print(text)
+    store_result(solution)
+    # 求出定义域内的解后，定义域需重新设置
+    if repl and (solution.domain_text() is not None):
+        D = None
+    return solution
 
 
-def inequ(expr, val, op):
-    """求解三角不等式
+def inequ(expr, val, op, context=None):
+    """求解三角不等式并输出
 
-    @param expr 一个式子
-    @param val  值
-    @param op   不等号
+    @param expr    一个式子
+    @param val     值
+    @param op      不等号
+    @param context 求解的上下文（SolverContext），默认使用set命令设置的D，用过后重置
     """
+    global D
+    repl = context is None
+    if repl:
+        context = SolverContext(D)
     try:
-        left = trig_eval(expr, "trig")
-        if not is_simplest(left):
-            print("ERROR: Only support simplest trigonometric inequation!")
-            return
-    except:
-        print("Error: Invalid left expr!")
+        solution = solve_inequality(expr, val, op, context.domain)
+        text = str(solution)
+    except TrigError as e:
+        print(e)
         return
+    except KeyboardInterrupt:
+        print("You stop to find solution")
+        return
+    print(text)
+    store_result(solution)
+    if repl and (solution.domain is not None):
+        D = None
+    return solution
+
+
+def value_range(expr, context=None):
+    """求值域并输出
+
+    @param expr    一个式子
+    @param context 求解的上下文（SolverContext），默认使用set命令设置的D，用过后重置
+    """
+    global D
+    repl = context is None
+    if repl:
+        context = SolverContext(D)
     try:
-        value = float(trig_eval(val))
-    except ValueError:
-        print("Error: Invalid right value!")
+        solution = solve_range(expr, context.domain)
+        text = str(solution)
+    except TrigError as e:
+        print(e)
         return
-    # 根据不等号设置区间开闭
-    def get_open(): return "(" if "=" not in op else "["
-    def get_close(): return ")" if "=" not in op else "]"
-    # sin和cos较麻烦，除了最后的print就别想看懂了（尽管有很多注释，但是不借助单位圆绝对无法理解）
-    if left.name == "sin":
-        try:
-            x1, x2 = get_trig("s", value)
-        except:
-            print("Error: Could not find solution!")
-            return
-        if ("<" in op):
-            # 解集是逆时针找出的，需对调始终边
-            x1, x2 = x2, x1
-            if value > 0:
-                # 此时解集穿过x轴正半轴，需表示成(2kπ-α, 2kπ+β)
-                x1 = [get_num_string(-2 * fp.pi + x1[1],
-                                     True), -2 * fp.pi + x1[1]]
-            elif value < 0:
-                # 此时终小于始，需调整
-                x2 = [get_num_string(x2[1] + 2 * fp.pi, True),
-                      x2[1] + 2 * fp.pi]
-        if ("<" in op) and (value == 0):
-            print("%s2k%s-%s, 2k%s%s" %
-                  ((get_open(), ) + (pi_s, ) * 3 + (get_close(), )))
-        else:
-            print("%s2k%s%s%s, 2k%s%s%s%s" % (get_open(
-            ), pi_s, "+" if x1[1] > 0 else "", x1[0] if x1[1] != 0 else "", pi_s, "+" if x2[1] > 0 else "", x2[0], get_close()))
-    elif left.name == "cos":
-        try:
-            x1, x2 = get_trig("c", value)
-        except:
-            print("Error: Could not find solution!")
-            return
-        if ("<" in op) and (value > 0):
-            # 此时解集为第一象限始边到第四象限终边，但由于上述单位圆特性，需对调始终边
-            x1, x2 = x2, x1
-            x2 = [get_num_string(x2[1] + 2 * fp.pi, True), x2[1] + 2 * fp.pi]
-        elif (">" in op) and (value < 0):
-            # 此时解集穿过x轴正半轴
-            x1, x2 = x2, x1
-            x1 = [get_num_string(-2 * fp.pi + x1[1], True), -2 * fp.pi + x1[1]]
-        if ("<" in op) and (value == 0):
-            print("%s2k%s+%s/2, 2k%s+3%s/2%s" %
-                  ((get_open(), ) + (pi_s, ) * 4 + (get_close(), )))
-        else:
-            print("%s2k%s%s%s, 2k%s%s%s%s" % (get_open(
-            ), pi_s, "+" if x1[1] >= 0 else "", x1[0], pi_s, "+" if x2[1] > 0 else "", x2[0], get_close()))
-    elif left.name == "tan":
-        # tan最简单，看函数图像即可出结果
-        sol = fp.atan(value)
-        if ">" in op:
-            print("%sk%s%s%s, k%s+%s/2)" % (get_open(), pi_s,
-                  "+" if sol >= 0 else "", get_num_string(sol), pi_s, pi_s))
-        elif "<" in op:
-            print("(k%s+%s/2, k%s%s%s%s" % (pi_s, pi_s, pi_s,
-                  "+" if sol >= 0 else "", get_num_string(sol), get_close()))
+    print(text)
+    store_result(solution)
+    if repl and (solution.domain is not None):
+        D = None
+    return solution
 
 
 def sol_trig(*args):
-    """解三角形"""
+    """解三角形并输出"""
     kwargs = {}
     which = False
     for arg in args:
@@ -654,32 +3643,77 @@ def sol_trig(*args):
         if arg == "get":
             which = True
             continue
-        k, v = arg.split("=")
         try:
-            if k in ["a", "b", "c", "area", "cric"]:
-                kwargs[k] = trig_eval(v)
-            elif k in ["A", "B", "C"]:
-                kwargs[k] = trig_eval(v, "ang")
-        except:
+            k, v = arg.split("=")
+        except ValueError:
             print("Error: Bad argument: \"%s\"!" % arg)
             return
+        kwargs[k] = v
     if isinstance(which, bool):
         print("Error: A unknow value must given!")
         return
-    trig = Triangle(**kwargs)
-    solution = trig.solve(which)
-    if isinstance(solution, mpmath.ctx_iv.ivmpf):
-        a, b = get_num_string(
-            float(solution.a)), get_num_string(float(solution.b))
-        print("(%s, %s)" % (a, b))
-    elif solution is None:
-        print("This triangle is unsolvable!")
-    else:
-        print(get_num_string(float(solution)))
+    try:
+        solution = solve_triangle(which, **kwargs)
+    except TrigError as e:
+        print(e)
+        return
+    print(solution)
+    store_result(solution)
+    return solution
+
+
+def set_precision(mode=None, dps=None, ambiguous=None, recognize=None):
+    """修改精度策略
+
+    @param mode       "float"（只用浮点数）、"adaptive"（无法确定时用mpmath，默认）或"high"（另外用mpmath的区间运算求范围）
+    @param dps        无法确定时重新计算所用的有效数字位数
+    @param ambiguous  差值不超过此值时视为无法确定
+    @param recognize  get_num_string识别sqrt(a/b)型等无理数时的容差
+    """
+    global high_precision, adaptive_precision, precision_dps, ambiguous_eps, recognize_eps
+    if mode is not None:
+        if mode not in ["float", "adaptive", "high"]:
+            raise ValueError("Unknown precision \"%s\"" % mode)
+        high_precision = mode == "high"
+        adaptive_precision = mode != "float"
+    if dps is not None:
+        if int(dps) <= 15:
+            raise ValueError("The dps must be greater than 15")
+        precision_dps = int(dps)
+    if ambiguous is not None:
+        ambiguous_eps = float(ambiguous)
+    if recognize is not None:
+        recognize_eps = float(recognize)
+        # 识别的结果随之改变
+        set_num_cache_size(num_cache_size)
+
+
+def set_identify(max_den=None, max_period=None):
+    """修改identify（get_num_string）的识别范围
+
+    @param max_den     分母（以及根号内的数）的上限
+    @param max_period  识别(p+q*sqrt(r))/d时循环连分数的最长周期
+    """
+    global identify_max_den, identify_max_period
+    if max_den is not None:
+        if int(max_den) <= 0:
+            raise ValueError("The denominator must be positive")
+        identify_max_den = int(max_den)
+    if max_period is not None:
+        if int(max_period) < 0:
+            raise ValueError("The period must be non-negative")
+        identify_max_period = int(max_period)
+    set_num_cache_size(num_cache_size)
+    # 小数是否视为近似值（见eval_exact）及弧度圈上识别出的精确值都与识别范围有关
+    exact_value.cache_clear()
+    exact_coeff.cache_clear()
+    with build_lock:
+        exact_trig_values.clear()
+        exact_trig_index.clear()
 
 
 def set_var(name, *args):
-    global D
+    global D, out
     if name == "D":
         if len(args) == 2:
             try:
@@ -689,31 +3723,632 @@ def set_var(name, *args):
                 D = [s, e]
             except:
                 print("Error: An invalid number!")
+    elif name == "precision":
+        if (len(args) == 1) and (args[0] in ["float", "adaptive", "high"]):
+            set_precision(args[0])
+        else:
+            print("Error: Precision must be \"float\", \"adaptive\" or \"high\"!")
+    elif name == "dps":
+        try:
+            set_precision(dps=int(args[0]))
+        except (ValueError, IndexError):
+            print("Error: The dps must be an integer greater than 15!")
+    elif name == "eps":
+        try:
+            set_precision(ambiguous=float(args[0]), recognize=float(args[1]) if len(args) > 1 else None)
+        except (ValueError, IndexError):
+            print("Error: Usage: set eps AMBIGUOUS [RECOGNIZE]")
+    elif name == "grid":
+        try:
+            set_unit_circle(*[int(n) for n in args])
+        except ValueError:
+            print("Error: An invalid number!")
+    elif name == "identify":
+        try:
+            set_identify(int(args[0]), int(args[1]) if len(args) > 1 else None)
+        except (ValueError, IndexError):
+            print("Error: Usage: set identify MAX_DEN [MAX_PERIOD]")
+    elif name == "out":
+        if (len(args) == 1) and (args[0] == "off"):
+            out = None
+        elif len(args) == 1:
+            out = args[0]
+        else:
+            print("Error: Usage: set out FILE|off")
+    elif name == "cache":
+        if (len(args) == 1) and (args[0] == "off"):
+            set_cache(None)
+        elif len(args) == 1:
+            set_cache(args[0])
+        else:
+            print("Error: Usage: set cache FILE|off")
     else:
         print("Error: No variable named \"%s\"!" % name)
 
 
-if __name__ == "__main__":
+def run_command(line, context=None):
+    """执行一条命令，返回False表示退出，否则返回求解的结果（没有时为None）
+
+    @param line    一行输入
+    @param context `do`命令的上下文（SolverContext），默认使用set命令设置的D、out
+    """
+    with profiler.stage("command"):
+        return dispatch_command(line, context)
+
+
+def stats(*args):
+    """开启、关闭、清空及输出计时的结果"""
+    if len(args) == 0:
+        print(profiler.format_report())
+    elif args[0] == "on":
+        profiler.enabled = True
+    elif args[0] == "off":
+        profiler.enabled = False
+    elif args[0] == "reset":
+        profiler.reset()
+    else:
+        print("Error: Usage: stats [on|off|reset]")
+
+
+def dispatch_command(line, context=None):
+    cmd, result = line.strip().split(" ", 1), None
+    if len(cmd) == 1:
+        action = cmd[0]
+        if action == "q":
+            return False
+        elif action == "stats":
+            stats()
+    else:
+        action, args = cmd
+        if action == "do":
+            if args.startswith("range "):
+                result = value_range(args[6:], context=context)
+            elif ("=" in args) and (">=" not in args) and ("<=" not in args):
+                result = equ(*args.split("=")[:2], context=context)
+            elif (">" in args) and (">=" not in args):
+                result = inequ(*args.split(">", 1), ">", context=context)
+            elif (">=" in args):
+                result = inequ(*args.split(">=", 1), ">=", context=context)
+            elif ("<" in args) and ("<=" not in args):
+                result = inequ(*args.split("<", 1), "<", context=context)
+            elif ("<=" in args):
+                result = inequ(*args.split("<=", 1), "<=", context=context)
+        elif action == "set":
+            set_var(*args.split(" "))
+        elif action == "trig":
+            result = sol_trig(*args.split(" "))
+        elif action == "stats":
+            stats(*args.split(" "))
+    return result
+
+
+def repl():
+    """交互模式"""
+    if sys.platform != "win32":
+        import readline
     while True:
-        cmd = input(">>> ").split(" ", 1)
-        if len(cmd) == 1:
-            action = cmd[0]
-            if action == "q":
-                exit()
+        try:
+            line = input(">>> ")
+        except EOFError:
+            break
+        try:
+            if run_command(line) is False:
+                break
+        except ImportError as e:
+            print("Error: %s" % e)
+
+
+def capture_command(line, context=None):
+    """执行一条命令，返回(输出的各行, 错误信息, 求解的结果)"""
+    import io
+    from contextlib import redirect_stdout
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            result = run_command(line, context)
+    except Exception as e:
+        return output.getvalue().splitlines(), "%s: %s" % (e.__class__.__name__, e), None
+    lines = output.getvalue().splitlines()
+    for l in lines:
+        if l.lower().startswith("error"):
+            return lines, l, None
+    return lines, None, result if result else None
+
+
+def batch_settings():
+    """批处理中随每条命令送出的设置：set grid、precision、dps、eps、identify、cache所改变的全局变量"""
+    mode = "high" if high_precision else "adaptive" if adaptive_precision else "float"
+    return (unit_circle_grid, mode, precision_dps, ambiguous_eps, recognize_eps,
+            identify_max_den, identify_max_period, None if result_cache is None else result_cache.path)
+
+
+def apply_settings(settings):
+    """使本进程的设置与batch_settings()的结果一致，只修改不同的部分（修改弧度圈等需要重建查找表）"""
+    grid, mode, dps, ambiguous, recognize, max_den, max_period, cache = settings
+    if grid != unit_circle_grid:
+        set_unit_circle(*grid)
+    set_precision(mode, dps, ambiguous, None if recognize == recognize_eps else recognize)
+    if (max_den, max_period) != (identify_max_den, identify_max_period):
+        set_identify(max_den, max_period)
+    if cache != (None if result_cache is None else result_cache.path):
+        set_cache(cache)
+
+
+def batch_worker(item):
+    """批处理中执行一条命令
+
+    @param item (行号, 命令, 上下文, 设置, 已有结果)，上下文为SolverContext，设置见batch_settings
+    """
+    lineno, line, context, settings, record = item
+    if record is not None:
+        return record
+    if settings != batch_settings():
+        apply_settings(settings)
+    output, error, result = capture_command(line, context)
+    record = {"line": lineno, "command": line, "output": output, "error": error,
+              "result": None if result is None else result.to_dict()}
+    if profiler.events is not None:
+        # 计时的结果交给主进程汇总
+        record["profile"], profiler.events = profiler.events, []
+    return record
+
+
+def start_profiling():
+    """批处理时在执行命令的进程中开启计时，只记录事件"""
+    profiler.enabled = True
+    profiler.events = []
+
+
+def batch_items(stream):
+    """逐行读取命令，`set`命令在此处执行
+
+    set D、set out设置的上下文随后一条`do`命令送出，其他设置随之后的每条命令送出，
+    因此无论命令在哪个进程中执行，都与在交互模式中依次执行的结果相同
+    """
+    global D, out
+    D = out = None
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if (not line) or line.startswith("#"):
+            continue
+        if line == "q":
+            break
+        if line.startswith("set "):
+            output, error, _ = capture_command(line)
+            yield lineno, line, None, None, {"line": lineno, "command": line, "output": output, "error": error, "result": None}
+        elif line.startswith("do "):
+            yield lineno, line, SolverContext(D, out), batch_settings(), None
+            D = out = None
+        else:
+            yield lineno, line, SolverContext(), batch_settings(), None
+
+
+def batch(path, jobs=None, chunksize=64, output=None, profile=False):
+    """批处理模式：逐行读取命令，以JSON Lines按顺序输出结果
+
+    @param path      命令文件，"-"表示标准输入
+    @param jobs      进程数，默认为CPU数，为1时不使用进程池
+    @param chunksize 每次交给一个进程的命令数
+    @param output    输出的文件对象，默认为标准输出
+    @param profile   是否计时，为True时结束后将各阶段的统计输出到标准错误
+    """
+    import json
+    from multiprocessing import Pool
+    output = sys.stdout if output is None else output
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    jobs = jobs or os.cpu_count() or 1
+    items = batch_items(stream)
+    # 子进程（或jobs为1时的本进程）只记录事件，由collector汇总
+    collector = Profiler() if profile else None
+    if profile and (jobs == 1):
+        start_profiling()
+    pool = Pool(jobs, start_profiling if profile else None) if jobs > 1 else None
+    try:
+        while True:
+            # 每次只读入有限的命令，使内存占用与输入规模无关
+            window = list(islice(items, jobs * chunksize * 4))
+            if not window:
+                break
+            if pool is None:
+                # 命令在本进程中执行时会改回各自的设置，之后须恢复读到此处时的设置
+                settings = batch_settings()
+                results = map(batch_worker, window)
+            else:
+                results = pool.imap(batch_worker, window, chunksize)
+            for record in results:
+                if "profile" in record:
+                    collector.replay(record.pop("profile"))
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            if pool is None:
+                apply_settings(settings)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if stream is not sys.stdin:
+            stream.close()
+        if profile:
+            profiler.enabled, profiler.events = False, None
+    if profile:
+        report = collector.report()
+        if pool is not None:
+            # 缓存在子进程中，本进程的数据没有意义
+            del report["caches"]
+        print(json.dumps(report, indent=2), file=sys.stderr)
+
+
+def solve_problem(problem):
+    """求解一个以字典表示的题目，返回{"result": 结构化的结果, "text": 字符串表示}或{"error": 错误信息}
+
+    {"type": "equation", "left": "sin(x)", "right": "1/2", "domain": ["0", "2*pi"]}
+    {"type": "inequality", "left": "sin(x)", "right": "1/2", "op": ">", "domain": ["0", "2*pi"]}
+    {"type": "triangle", "known": {"b": "sqrt(3)", "B": "pi/3"}, "get": "2*a+c"}
+    {"type": "range", "expr": "sin(x)+cos(x)", "domain": ["0", "pi/2"]}
+    """
+    try:
+        kind = problem.get("type")
+        domain = problem.get("domain")
+        if domain is not None:
+            try:
+                domain = sorted(float(trig_eval(v) if isinstance(v, str) else v) for v in domain)
+            except ValueError:
+                raise TrigError("Error: An invalid number!") from None
+        if kind == "equation":
+            solution = solve_equation(problem["left"], problem["right"], domain)
+        elif kind == "inequality":
+            if problem.get("op") not in [">", ">=", "<", "<="]:
+                raise TrigError("Error: Invalid operator!")
+            solution = solve_inequality(problem["left"], problem["right"], problem["op"], domain)
+        elif kind == "triangle":
+            solution = solve_triangle(problem["get"], **problem.get("known", {}))
+        elif kind == "range":
+            solution = solve_range(problem["expr"], domain)
         else:
-            action, args = cmd
-            if action == "do":
-                if ("=" in args) and (">=" not in args) and ("<=" not in args):
-                    equ(*args.split("=")[:2])
-                elif (">" in args) and (">=" not in args):
-                    inequ(*args.split(">", 1), ">")
-                elif (">=" in args):
-                    inequ(*args.split(">=", 1), ">=")
-                elif ("<" in args) and ("<=" not in args):
-                    inequ(*args.split("<", 1), "<")
-                elif ("<=" in args):
-                    inequ(*args.split("<=", 1), "<=")
-            elif action == "set":
-                set_var(*args.split(" "))
-            elif action == "trig":
-                sol_trig(*args.split(" "))
+            raise TrigError("Error: Unknown problem type \"%s\"!" % kind)
+        result = {"result": solution.to_dict(), "text": str(solution)}
+        store_result(solution)
+        return result
+    except TrigError as e:
+        return {"error": str(e)}
+    except (KeyError, TypeError, AttributeError) as e:
+        return {"error": "Error: Bad problem: %s" % e}
+
+
+def warm_worker():
+    """预先建立各种查找表，使服务的进程一开始就是“热”的"""
+    build_num_table()
+    build_trig_index()
+
+
+def serve_worker(conn):
+    """服务的进程：预热后逐个接收题目、送回solve_problem的结果，收到None时退出"""
+    warm_worker()
+    while (problem := conn.recv()) is not None:
+        try:
+            result = solve_problem(problem)
+        except Exception as e:
+            result = {"error": "Error: %s: %s" % (e.__class__.__name__, e)}
+        conn.send(result)
+
+
+class ServerWorker():
+    """服务中的一个进程，一次只求解一道题，超时时可单独杀死（ProcessPoolExecutor只能连同整个进程池一起结束）"""
+
+    def __init__(self):
+        from multiprocessing import Pipe, Process
+        self.conn, child = Pipe()
+        self.process = Process(target=serve_worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def call(self, problem):
+        """将题目交给进程并等待结果（在线程中调用），进程退出时抛出EOFError或OSError"""
+        self.conn.send(problem)
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        """让进程求解完手上的题目后退出，1秒内没有退出时杀死"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+
+class HTTPError(Exception):
+    """TrigServer读入请求时出错，status为返回的状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TrigServer():
+    """以JSON提供求解服务的HTTP服务器
+
+    POST /solve  请求体为solve_problem所接受的题目
+    GET /health  健康检查
+    GET /metrics 请求数、超时数、拒绝数及用时的统计
+    """
+
+    # 请求中首部的行数上限
+    max_headers = 100
+
+    def __init__(self, jobs=None, queue=64, timeout=10.0, max_body=1 << 16, max_header=1 << 14):
+        self.jobs = jobs or os.cpu_count() or 1
+        # 同时打开的连接（含正在求解及排队的请求）数的上限，超出时立即返回503
+        self.capacity = self.jobs + queue
+        self.timeout = timeout
+        self.max_body = max_body
+        self.max_header = max_header
+        self.connections = 0
+        self.in_flight = 0
+        self.counters = {"requests": 0, "solved": 0, "failed": 0, "rejected": 0, "timeouts": 0, "restarts": 0}
+        self.profiler = Profiler()
+        self.profiler.enabled = True
+        # 所有进程，以及其中空闲的（asyncio.Queue）
+        self.workers = set()
+        self.idle = None
+        # 每个进程在一个线程中等待结果
+        self.threads = None
+
+    def start_workers(self):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        self.idle = asyncio.Queue()
+        self.threads = ThreadPoolExecutor(self.jobs)
+        for _ in range(self.jobs):
+            self.add_worker()
+
+    def add_worker(self):
+        worker = ServerWorker()
+        self.workers.add(worker)
+        self.idle.put_nowait(worker)
+
+    async def replace_worker(self, worker):
+        """杀死worker（超时或意外退出）并换上新的进程，其他进程不受影响"""
+        import asyncio
+        self.workers.discard(worker)
+        await asyncio.to_thread(worker.kill)
+        self.counters["restarts"] += 1
+        self.add_worker()
+
+    def stop_workers(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers.clear()
+        self.threads.shutdown()
+
+    async def run(self, problem):
+        """等到一个空闲的进程并在其中求解，超时时（含等待的时间）抛出TimeoutError，进程意外退出时抛出EOFError"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        worker = await asyncio.wait_for(self.idle.get(), self.timeout)
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(self.threads, worker.call, problem),
+                                            max(deadline - loop.time(), 0))
+        except (asyncio.TimeoutError, EOFError, OSError):
+            # 算不完的进程必须杀死，否则会一直占着名额
+            await self.replace_worker(worker)
+            raise
+        self.idle.put_nowait(worker)
+        return result
+
+    async def solve(self, body):
+        import asyncio
+        import json
+        try:
+            problem = json.loads(body)
+            if not isinstance(problem, dict):
+                raise ValueError()
+        except ValueError:
+            return 400, {"error": "Error: The request body must be a JSON object!"}
+        self.in_flight += 1
+        start = perf_counter()
+        try:
+            result = await self.run(problem)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return 504, {"error": "Error: Timeout after %gs!" % self.timeout}
+        except (EOFError, OSError):
+            self.counters["failed"] += 1
+            return 503, {"error": "Error: The worker exited unexpectedly!"}
+        finally:
+            # 超时的进程已被杀死，此时才释放名额
+            self.in_flight -= 1
+            self.profiler.record("solve", perf_counter() - start)
+        if "error" in result:
+            self.counters["failed"] += 1
+            return 422, result
+        self.counters["solved"] += 1
+        return 200, result
+
+    async def health(self):
+        """所有进程都在运行，且还能接受请求时为"ok"，否则为"degraded"（503）"""
+        alive = sum(worker.process.is_alive() for worker in self.workers)
+        # 本次健康检查的连接也算在内
+        healthy = (alive == self.jobs) and (self.connections < self.capacity)
+        return 200 if healthy else 503, {"status": "ok" if healthy else "degraded", "workers": alive,
+                                         "idle": self.idle.qsize(), "in_flight": self.in_flight,
+                                         "connections": self.connections, "capacity": self.capacity,
+                                         "restarts": self.counters["restarts"]}
+
+    def metrics(self):
+        report = self.profiler.report()
+        return {"counters": dict(self.counters), "in_flight": self.in_flight, "connections": self.connections,
+                "capacity": self.capacity,
+                "workers": self.jobs, "timeout": self.timeout, "latency": report["stages"]}
+
+    async def route(self, method, path, body):
+        path = path.split("?", 1)[0]
+        if path == "/solve":
+            if method != "POST":
+                return 405, {"error": "Error: Use POST!"}
+            return await self.solve(body)
+        elif path == "/health":
+            return await self.health()
+        elif path == "/metrics":
+            return 200, self.metrics()
+        return 404, {"error": "Error: Not found!"}
+
+    async def read_request(self, reader):
+        """读入请求行、首部及请求体，返回(方法, 路径, 请求体)，出错时抛出HTTPError"""
+        import asyncio
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers, lines, size = {}, 0, 0
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                lines, size = lines + 1, size + len(line)
+                if (lines > self.max_headers) or (size > self.max_header):
+                    raise HTTPError(431, "Error: The request headers are too large!")
+                k, v = line.decode("latin-1").split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body:
+                raise HTTPError(413, "Error: The request body is too large!")
+            body = await reader.readexactly(length) if length > 0 else b""
+        except (ValueError, asyncio.IncompleteReadError):
+            raise HTTPError(400, "Error: Bad request!") from None
+        return method, path, body
+
+    async def respond(self, reader):
+        """读入请求（不超过timeout秒）并处理，返回(状态码, 内容)"""
+        import asyncio
+        try:
+            request = await asyncio.wait_for(self.read_request(reader), self.timeout)
+            return await self.route(*request)
+        except asyncio.TimeoutError:
+            # 求解的超时在solve中处理，此处只会是读入请求太慢
+            return 408, {"error": "Error: Timeout while reading the request!"}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": "Error: %s: %s" % (e.__class__.__name__, e)}
+
+    async def handle(self, reader, writer):
+        import asyncio
+        import json
+        start = perf_counter()
+        self.counters["requests"] += 1
+        busy = self.connections >= self.capacity
+        self.connections += 1
+        try:
+            if busy:
+                # 连接（而不只是求解）都算作名额，慢或不发送数据的客户端也不能无限地占用
+                self.counters["rejected"] += 1
+                status, payload = 503, {"error": "Error: The server is busy!"}
+            else:
+                status, payload = await self.respond(reader)
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout",
+                      413: "Payload Too Large", 422: "Unprocessable Entity", 431: "Request Header Fields Too Large",
+                      500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}[status]
+            writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\n"
+                          "Content-Length: %d\r\nConnection: close\r\n\r\n" % (status, reason, len(data))).encode("latin-1") + data)
+            try:
+                await asyncio.wait_for(writer.drain(), self.timeout)
+                writer.close()
+                await asyncio.wait_for(writer.wait_closed(), self.timeout)
+            except (ConnectionError, asyncio.TimeoutError):
+                writer.transport.abort()
+        finally:
+            self.connections -= 1
+        self.profiler.record("request", perf_counter() - start)
+
+    async def serve(self, address):
+        """开始服务
+
+        @param address "HOST:PORT"、"PORT"或"unix:PATH"
+        """
+        import asyncio
+        self.start_workers()
+        try:
+            host, port = parse_address(address)
+            if port is None:
+                server = await asyncio.start_unix_server(self.handle, host)
+            else:
+                server = await asyncio.start_server(self.handle, host, port)
+            print("Serving on %s" % address, file=sys.stderr)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop_workers()
+
+
+def parse_address(address):
+    """将服务的地址解析为(主机, 端口)，"unix:PATH"为(PATH, None)，地址有误时抛出ValueError"""
+    if address.startswith("unix:"):
+        if len(address) == 5:
+            raise ValueError("Error: The socket path is empty!")
+        return address[5:], None
+    host, _, port = address.rpartition(":")
+    if (not port.isdigit()) or (not 0 < int(port) < 65536):
+        raise ValueError("Error: Invalid address \"%s\"!" % address)
+    return host or "127.0.0.1", int(port)
+
+
+def serve(address, jobs=None, queue=64, timeout=10.0):
+    """服务模式，见TrigServer"""
+    import asyncio
+    try:
+        asyncio.run(TrigServer(jobs, queue, timeout).serve(address))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="最简三角方程、最简三角不等式以及三角形求解器")
+    parser.add_argument("--batch", metavar="FILE", help="批处理FILE中的命令（\"-\"表示标准输入），以JSON Lines输出结果")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="批处理或服务使用的进程数（默认为CPU数）")
+    parser.add_argument("--chunksize", type=int, default=64, help="批处理时每次交给一个进程的命令数")
+    parser.add_argument("--profile", action="store_true", help="批处理结束后将各阶段的用时输出到标准错误")
+    parser.add_argument("--serve", metavar="ADDRESS", help="以HTTP提供JSON求解服务，ADDRESS为\"HOST:PORT\"、\"PORT\"或\"unix:PATH\"")
+    parser.add_argument("--queue", type=int, default=64, help="服务时最多排队的请求（连接）数，超出时返回503")
+    parser.add_argument("--timeout", type=float, default=10.0, help="服务时读入及求解每个请求的超时时间（秒），求解超时的进程被杀死并换成新的")
+    parser.add_argument("--triangles", metavar="FILE", help="批量解三角形，FILE为CSV或.npy（见solve_triangle_file）")
+    parser.add_argument("--out", metavar="FILE", default="-", help="批量解三角形的输出（.npy或CSV，默认为标准输出）")
+    parser.add_argument("--chunk", type=int, default=65536, help="批量解三角形时每块的行数")
+    parser.add_argument("--cache", metavar="FILE", help="将求解的结果缓存在FILE（SQLite）中，多次运行及各进程共用")
+    args = parser.parse_args(argv)
+    if args.serve is not None:
+        try:
+            parse_address(args.serve)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.cache is not None:
+        # 以spawn方式启动的子进程通过环境变量得知缓存的位置
+        os.environ["TRIG_CACHE"] = args.cache
+        set_cache(args.cache)
+    if args.triangles is not None:
+        try:
+            solve_triangle_file(args.triangles, args.out, args.chunk)
+        except TrigError as e:
+            # 文件内容有误，不是命令行的用法有误
+            sys.exit(str(e))
+        except OSError as e:
+            sys.exit("Error: %s" % e)
+    elif args.serve is not None:
+        try:
+            serve(args.serve, args.jobs, args.queue, args.timeout)
+        except OSError as e:
+            sys.exit("Error: %s" % e)
+    elif args.batch is not None:
+        try:
+            batch(args.batch, args.jobs, args.chunksize, profile=args.profile)
+        except OSError as e:
+            sys.exit("Error: %s" % e)
+    else:
+        repl()
+
+
+if __name__ == "__main__":
+    main()